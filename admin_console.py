@@ -0,0 +1,88 @@
+import os
+import sys
+import asyncio
+import threading
+from logger import Logger
+
+
+class AdminConsole:
+    """Admin command input that never blocks the event loop.
+
+    Commands are read from a local Unix socket and, if attached to a terminal, from stdin.
+    Every line is passed to the given handler coroutine on the bot's event loop. Socket clients get the
+    handler's output or an error line back, terminated by an empty line.
+    """
+
+    def __init__(self, handler, logger: Logger, socket_path: str = None, use_stdin: bool = True):
+        self.handler = handler
+        self.l = logger
+        self.socket_path = socket_path
+        self.use_stdin = use_stdin
+        self.server = None
+        self.stdin_task = None
+
+    async def start(self):
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            self.l.info(f"Admin socket listening on {self.socket_path}")
+        if self.use_stdin and sys.stdin is not None and sys.stdin.isatty():
+            self.stdin_task = asyncio.create_task(self.read_stdin())
+            self.l.info("type help for available commands")
+
+    async def close(self):
+        if self.stdin_task:
+            self.stdin_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    async def read_stdin(self):
+        # input() blocks, so it runs on a daemon thread and lines are handed over through a queue
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+
+        def worker():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+
+        threading.Thread(target=worker, name="admin-stdin", daemon=True).start()
+        while (line := await lines.get()) is not None:
+            await self.dispatch(line)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                result = await self.dispatch(line.decode())
+                lines = [l for l in result.splitlines() if l.strip()] or ['ok']
+                writer.write(''.join(f'{l}\n' for l in lines + ['']).encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def dispatch(self, line: str) -> str:
+        try:
+            return await self.handler(line.strip()) or ''
+        except Exception as e:
+            self.l.error(f'Exception in admin command "{line.strip()}": {e}')
+            return f'error: {e}'
+
+
+async def send_command(socket_path: str, command: str):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(f'{command}\n'.encode())
+    await writer.drain()
+    while (line := (await reader.readline()).decode()).strip():
+        print(line.rstrip('\n'))
+    writer.close()
+    await writer.wait_closed()
+
+
+if __name__ == "__main__":
+    # e.g. docker exec <container> python admin_console.py blacklist some_user
+    asyncio.run(send_command(os.getenv('ADMIN_SOCKET', '/tmp/streamer_shield.sock'), ' '.join(sys.argv[1:]) or 'help'))
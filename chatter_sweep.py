@@ -0,0 +1,115 @@
+import asyncio
+from logger import Logger
+from shield_state import ShieldState
+from twitchAPI.twitch import Twitch
+
+
+class ChatterSweeper:
+    """Periodically pages through the Helix chatters list of every joined channel.
+
+    Only chatters that were not evaluated in that channel yet are passed on to the check function, at
+    most max_new per sweep, after resolving them 100 logins per request so the checks find them cached.
+    The interval of each channel shrinks while sweeps keep finding new chatters and grows while they
+    do not, and it never drops below what the shared request budget allows for all channels together.
+    """
+
+    def __init__(self, twitch: Twitch, moderator_id: str, check, state: ShieldState, logger: Logger, config):
+        self.twitch = twitch
+        self.moderator_id = moderator_id
+        self.check = check
+        self.state = state
+        self.l = logger
+        self.base_interval = config.sweep_interval
+        self.min_interval = config.sweep_min_interval
+        self.max_interval = config.sweep_max_interval
+        self.request_budget = config.sweep_request_budget
+        self.concurrency = config.sweep_concurrency
+        self.max_new = config.sweep_max_new
+        self.tasks: dict = {}
+        self.evaluated: dict = {}
+        # Helix requests of the last sweep per channel, chatter pages and user lookups
+        self.requests: dict = {}
+
+    def start(self, channel_name: str, broadcaster_id: str):
+        if channel_name in self.tasks:
+            return
+        self.tasks[channel_name] = asyncio.create_task(self.sweep_loop(channel_name, broadcaster_id))
+
+    def stop(self, channel_name: str):
+        task = self.tasks.pop(channel_name, None)
+        if task:
+            task.cancel()
+        self.requests.pop(channel_name, None)
+        # a rejoined channel starts over, chatters seen before leaving are checked again
+        self.evaluated.pop(channel_name, None)
+
+    def stop_all(self):
+        for channel_name in list(self.tasks):
+            self.stop(channel_name)
+
+    def budget_interval(self) -> float:
+        """Shortest interval that keeps all channels together within the request budget per minute"""
+        return sum(self.requests.values()) * 60 / self.request_budget
+
+    async def sweep_loop(self, channel_name: str, broadcaster_id: str):
+        interval = self.base_interval
+        while True:
+            try:
+                new, total = await self.sweep(channel_name, broadcaster_id)
+                if new:
+                    self.l.info(f"Chatter sweep in {channel_name}: {new} new of {total} chatters")
+                    interval /= 2
+                else:
+                    interval *= 1.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.l.error(f"Chatter sweep in {channel_name} failed: {e}")
+                interval = self.max_interval
+            interval = min(max(interval, self.min_interval, self.budget_interval()), self.max_interval)
+            await asyncio.sleep(interval)
+
+    async def sweep(self, channel_name: str, broadcaster_id: str):
+        chatters = []
+        requests = 0
+        cursor = None
+        while True:
+            response = await self.twitch.get_chatters(broadcaster_id, self.moderator_id, first=1000, after=cursor)
+            requests += 1
+            chatters.extend(chatter.user_login for chatter in response.data)
+            cursor = response.cursor
+            if not cursor:
+                break
+
+        evaluated = self.evaluated.get(channel_name, set())
+        # chatters over the cap stay unevaluated and are picked up by the next sweeps
+        new = [name for name in chatters if name not in evaluated and not self.state.is_cleared(broadcaster_id, name)][:self.max_new]
+        # only remember chatters that are still present, so the set is bounded by the chatter list
+        self.evaluated[channel_name] = (evaluated | set(new)) & set(chatters)
+        resolved, lookups = await self.resolve(new)
+        self.requests[channel_name] = requests + lookups
+        await self.evaluate(broadcaster_id, resolved)
+        return len(new), len(chatters)
+
+    async def resolve(self, names: list):
+        """Seed the user cache for names that are not cached yet, returns the names Twitch knows and the request count"""
+        missing = [name for name in names if self.state.get_user(name) is None]
+        requests = 0
+        for i in range(0, len(missing), 100):
+            requests += 1
+            async for user in self.twitch.get_users(logins=missing[i:i + 100]):
+                self.state.put_user(user.login, user)
+        # accounts that could not be resolved were deleted or suspended, checking them would only cost more requests
+        return [name for name in names if self.state.get_user(name) is not None], requests
+
+    async def evaluate(self, broadcaster_id: str, names: list):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check_one(name: str):
+            async with semaphore:
+                try:
+                    await self.check(name, broadcaster_id)
+                except Exception as e:
+                    self.l.error(f"Failed to check {name} from chatter sweep: {e}")
+
+        await asyncio.gather(*(check_one(name) for name in names))
@@ -1,12 +1,89 @@
+import re
+import json
+import time
+import uuid
+import asyncio
 import asyncpg
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta, timezone
 from typing import List, Dict, Any, Optional
 from logger import Logger
+from username_prefilter import UsernamePrefilter
+from known_user_index import KnownUserIndex
+from profiler import tracer
+from migrations import MigrationRunner
+from shared_cache import CACHE_CHANNEL
+
+# Statements on the check_user hot path, prepared once on every new pool connection
+HOT_STATEMENTS = {
+    'is_whitelisted': 'SELECT 1 FROM whitelist WHERE lower(username) = lower($1) LIMIT 1',
+    'is_blacklisted': 'SELECT 1 FROM blacklist WHERE lower(username) = lower($1) LIMIT 1',
+    'is_known_user': 'SELECT 1 FROM known_users WHERE lower(username) = lower($1) LIMIT 1',
+    'add_known_user': '''
+        INSERT INTO known_users (username, confidence_score, account_age_years, account_age_months, account_age_days, model_version)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (username) DO UPDATE SET
+            confidence_score = COALESCE($2, known_users.confidence_score),
+            account_age_years = COALESCE($3, known_users.account_age_years),
+            account_age_months = COALESCE($4, known_users.account_age_months),
+            account_age_days = COALESCE($5, known_users.account_age_days),
+            model_version = COALESCE($6, known_users.model_version),
+            updated_at = CURRENT_TIMESTAMP
+    '''
+}
+
+
+class QueryTimings:
+    """Per query latency and pool wait statistics"""
+
+    def __init__(self):
+        self.queries: Dict[str, list] = {}
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def record_query(self, name: str, seconds: float):
+        entry = self.queries.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'pool_wait': {
+                'count': self.wait_count,
+                'avg_ms': round(self.wait_total / self.wait_count * 1000, 2) if self.wait_count else 0.0,
+                'max_ms': round(self.wait_max * 1000, 2)
+            },
+            'queries': {
+                name: {
+                    'count': count,
+                    'avg_ms': round(total / count * 1000, 2),
+                    'max_ms': round(longest * 1000, 2)
+                } for name, (count, total, longest) in sorted(self.queries.items())
+            }
+        }
+
 
 class DatabaseManager:
     def __init__(self, config):
         self.config = config
         self.pool = None
         self.logger = config.logger
+        self.blacklist_prefilter = UsernamePrefilter(config.prefilter_patterns, config.prefilter_match_templates)
+        self.known_user_index = KnownUserIndex(config.known_users_capacity, config.known_users_error_rate)
+        self.timings = QueryTimings()
+        # prepared statements per backend pid, filled by the pool init hook
+        self.statements: Dict[int, Dict[str, Any]] = {}
+        self.decision_partitions: set = set()
+        self.online_migration_task = None
+        # identifies this instance in cache notifications, so it can skip its own
+        self.node_id = uuid.uuid4().hex
 
     async def initialize_pool(self):
         """Initialize the database connection pool"""
@@ -17,100 +94,113 @@ class DatabaseManager:
                 database=self.config.db_name,
                 user=self.config.db_user,
                 password=self.config.db_password,
-                min_size=1,
-                max_size=10
+                min_size=self.config.db_pool_min_size,
+                max_size=self.config.db_pool_max_size,
+                max_queries=self.config.db_max_queries,
+                max_inactive_connection_lifetime=self.config.db_max_inactive_connection_lifetime,
+                command_timeout=self.config.db_command_timeout or None,
+                statement_cache_size=self.config.db_statement_cache_size,
+                init=self.prepare_connection
             )
             self.logger.passing("Database connection pool initialized")
         except Exception as e:
             self.logger.error(f"Failed to initialize database pool: {e}")
             raise
 
-    async def close_pool(self):
-        """Close the database connection pool"""
-        if self.pool:
-            await self.pool.close()
-            self.logger.info("Database connection pool closed")
-
-    async def create_tables(self):
-        """Create all necessary tables if they don't exist"""
-        async with self.pool.acquire() as conn:
-            # Create whitelist table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS whitelist (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(255) UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    async def connect(self) -> asyncpg.Connection:
+        """Open a connection outside the pool, for listeners that hold it for their whole lifetime"""
+        return await asyncpg.connect(
+            host=self.config.db_host,
+            port=self.config.db_port,
+            database=self.config.db_name,
+            user=self.config.db_user,
+            password=self.config.db_password
+        )
 
-            # Create blacklist table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS blacklist (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(255) UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    async def prepare_connection(self, conn: asyncpg.Connection):
+        """Pool init hook, prepares the hot statements once per connection"""
+        pid = conn.get_server_pid()
+        try:
+            self.statements[pid] = {name: await conn.prepare(sql) for name, sql in HOT_STATEMENTS.items()}
+        except (asyncpg.UndefinedTableError, asyncpg.UndefinedColumnError):
+            # the schema is not migrated yet, statements get prepared on first use instead
+            self.statements[pid] = {}
+        conn.add_termination_listener(lambda _: self.statements.pop(pid, None))
 
-            # Create joinable channels table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS joinable_channels (
-                    id SERIAL PRIMARY KEY,
-                    channel_name VARCHAR(255) UNIQUE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    async def statement(self, conn, name: str):
+        """Return the prepared hot statement for this connection"""
+        prepared = self.statements.setdefault(conn.get_server_pid(), {})
+        if name not in prepared:
+            prepared[name] = await conn.prepare(HOT_STATEMENTS[name])
+        return prepared[name]
 
-            # Create known users table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS known_users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(255) UNIQUE,
-                    confidence_score INTEGER,
-                    account_age_years INTEGER,
-                    account_age_months INTEGER,
-                    account_age_days INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    @asynccontextmanager
+    async def acquire(self, name: str):
+        """Acquire a pool connection, recording pool wait and query time under the given name"""
+        start = time.perf_counter()
+        with tracer.span(f'db.{name}'):
+            async with self.pool.acquire(timeout=self.config.db_acquire_timeout or None) as conn:
+                acquired = time.perf_counter()
+                waited = acquired - start
+                self.timings.record_wait(waited)
+                if waited * 1000 > self.config.db_pool_wait_warning_ms:
+                    self.logger.warning(f"Waited {waited * 1000:.1f}ms for a database connection ({name}), pool size {self.pool.get_size()}, idle {self.pool.get_idle_size()}")
+                try:
+                    yield conn
+                finally:
+                    self.timings.record_query(name, time.perf_counter() - acquired)
 
-            # Create settings table
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    id SERIAL PRIMARY KEY,
-                    key VARCHAR(255) UNIQUE NOT NULL,
-                    value TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    def stats(self) -> Dict[str, Any]:
+        """Return pool usage and per query timings"""
+        summary = self.timings.summary()
+        if self.pool:
+            summary['pool'] = {
+                'size': self.pool.get_size(),
+                'idle': self.pool.get_idle_size(),
+                'min': self.pool.get_min_size(),
+                'max': self.pool.get_max_size()
+            }
+        return summary
 
-            # Create indexes
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_whitelist_username ON whitelist(username)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_blacklist_username ON blacklist(username)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_channels_name ON joinable_channels(channel_name)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_known_users_username ON known_users(username)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_settings_key ON settings(key)')
+    async def close_pool(self):
+        """Close the database connection pool"""
+        if self.online_migration_task and not self.online_migration_task.done():
+            # cancelling aborts the concurrent index build, the invalid index is rebuilt on the next start
+            self.online_migration_task.cancel()
+            try:
+                await self.online_migration_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.pool:
+            await self.pool.close()
+            self.logger.info("Database connection pool closed")
 
-            # Initialize pat counter if it doesn't exist
-            await conn.execute('''
-                INSERT INTO settings (key, value) VALUES ('pat_counter', '0')
-                ON CONFLICT (key) DO NOTHING
-            ''')
+    async def migrate(self):
+        """Apply pending schema migrations, indexes that can be built online are built in the background"""
+        runner = MigrationRunner(self.pool, self.logger)
+        online = await runner.run()
+        if online:
+            self.online_migration_task = asyncio.create_task(runner.run_online(online))
+            self.online_migration_task.add_done_callback(self.online_migration_done)
+        self.logger.passing("Database schema is up to date")
 
-            self.logger.passing("Database tables created/verified")
+    def online_migration_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.logger.error(f"Online migration failed, username lookups run without their lower(username) indexes until the next start: {error!r}")
 
     # Whitelist methods
     async def get_whitelist(self) -> List[str]:
         """Get all usernames from whitelist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_whitelist') as conn:
             rows = await conn.fetch('SELECT username FROM whitelist ORDER BY username')
             return [row['username'] for row in rows]
 
     async def add_to_whitelist(self, username: str) -> bool:
         """Add username to whitelist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('add_to_whitelist') as conn:
             try:
                 await conn.execute('INSERT INTO whitelist (username) VALUES ($1)', username)
                 return True
@@ -119,42 +209,62 @@ class DatabaseManager:
 
     async def remove_from_whitelist(self, username: str) -> bool:
         """Remove username from whitelist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('remove_from_whitelist') as conn:
             result = await conn.execute('DELETE FROM whitelist WHERE username = $1', username)
-            return result != 'DELETE 0'
+            if result == 'DELETE 0':
+                return False
+            await self.notify_list_change(conn, 'unwhitelist', username)
+            return True
 
     # Blacklist methods
     async def get_blacklist(self) -> List[str]:
         """Get all usernames from blacklist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_blacklist') as conn:
             rows = await conn.fetch('SELECT username FROM blacklist ORDER BY username')
             return [row['username'] for row in rows]
 
     async def add_to_blacklist(self, username: str) -> bool:
         """Add username to blacklist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('add_to_blacklist') as conn:
             try:
                 await conn.execute('INSERT INTO blacklist (username) VALUES ($1)', username)
+                self.blacklist_prefilter.add(username)
+                await self.notify_list_change(conn, 'blacklist', username)
                 return True
             except asyncpg.UniqueViolationError:
+                self.blacklist_prefilter.add(username)
                 return False
 
     async def remove_from_blacklist(self, username: str) -> bool:
         """Remove username from blacklist"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('remove_from_blacklist') as conn:
             result = await conn.execute('DELETE FROM blacklist WHERE username = $1', username)
-            return result != 'DELETE 0'
+            self.blacklist_prefilter.remove(username)
+            if result == 'DELETE 0':
+                return False
+            await self.notify_list_change(conn, 'unblacklist', username)
+            return True
+
+    async def load_blacklist_prefilter(self):
+        """Build the blacklist prefilter from the blacklist table"""
+        self.blacklist_prefilter.load(await self.get_blacklist())
+        self.logger.passing(f"Blacklist prefilter loaded with {len(self.blacklist_prefilter.names)} entries")
+
+    async def notify_list_change(self, conn, kind: str, username: str):
+        """Tell the other instances to update their local caches for this user"""
+        payload = json.dumps({'node': self.node_id, 'kind': kind, 'username': username})
+        await conn.execute('SELECT pg_notify($1, $2)', CACHE_CHANNEL, payload)
 
     # Joinable channels methods
     async def get_joinable_channels(self) -> List[str]:
         """Get all channel names from joinable_channels"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_joinable_channels') as conn:
             rows = await conn.fetch('SELECT channel_name FROM joinable_channels ORDER BY channel_name')
             return [row['channel_name'] for row in rows]
 
     async def add_joinable_channel(self, channel_name: str) -> bool:
         """Add channel to joinable channels"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('add_joinable_channel') as conn:
             try:
                 await conn.execute('INSERT INTO joinable_channels (channel_name) VALUES ($1)', channel_name)
                 return True
@@ -163,14 +273,14 @@ class DatabaseManager:
 
     async def remove_joinable_channel(self, channel_name: str) -> bool:
         """Remove channel from joinable channels"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('remove_joinable_channel') as conn:
             result = await conn.execute('DELETE FROM joinable_channels WHERE channel_name = $1', channel_name)
             return result != 'DELETE 0'
 
     # Known users methods
     async def get_known_users(self) -> Dict[str, Any]:
         """Get all known users as a dictionary (compatible with existing JSON format)"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_known_users') as conn:
             rows = await conn.fetch('''
                 SELECT username, confidence_score, account_age_years, account_age_months, account_age_days
                 FROM known_users ORDER BY username
@@ -187,37 +297,193 @@ class DatabaseManager:
 
     async def add_known_user(self, username: str, confidence_score: int = None,
                            account_age_years: int = None, account_age_months: int = None,
-                           account_age_days: int = None) -> bool:
+                           account_age_days: int = None, model_version: str = None) -> bool:
         """Add or update known user"""
-        async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO known_users (username, confidence_score, account_age_years, account_age_months, account_age_days)
-                VALUES ($1, $2, $3, $4, $5)
-                ON CONFLICT (username) DO UPDATE SET
-                    confidence_score = COALESCE($2, known_users.confidence_score),
-                    account_age_years = COALESCE($3, known_users.account_age_years),
-                    account_age_months = COALESCE($4, known_users.account_age_months),
-                    account_age_days = COALESCE($5, known_users.account_age_days),
-                    updated_at = CURRENT_TIMESTAMP
-            ''', username, confidence_score, account_age_years, account_age_months, account_age_days)
+        async with self.acquire('add_known_user') as conn:
+            statement = await self.statement(conn, 'add_known_user')
+            await statement.fetch(username, confidence_score, account_age_years, account_age_months, account_age_days, model_version)
+            self.known_user_index.add(username)
             return True
 
+    async def load_known_user_index(self, batch_size: int = 10000):
+        """Build the known user index by streaming usernames from the known_users table"""
+        async with self.acquire('load_known_user_index') as conn:
+            async with conn.transaction():
+                async for row in conn.cursor('SELECT username FROM known_users WHERE username IS NOT NULL', prefetch=batch_size):
+                    self.known_user_index.add(row['username'])
+        self.known_user_index.ready = True
+        self.logger.passing(f"Known user index loaded with {self.known_user_index.count} entries")
+
+    async def get_known_users_page(self, after_id: int, limit: int) -> List[asyncpg.Record]:
+        """Get the next page of (id, username) rows ordered by id, for batch jobs over known_users"""
+        async with self.acquire('get_known_users_page') as conn:
+            return await conn.fetch('''
+                SELECT id, username FROM known_users
+                WHERE id > $1 AND username IS NOT NULL
+                ORDER BY id LIMIT $2
+            ''', after_id, limit)
+
+    async def update_confidence_scores(self, usernames: List[str], scores: List[int], model_version: str) -> int:
+        """Bulk update confidence scores and the model version that produced them"""
+        async with self.acquire('update_confidence_scores') as conn:
+            result = await conn.execute('''
+                UPDATE known_users SET
+                    confidence_score = scores.score,
+                    model_version = $3,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM unnest($1::VARCHAR[], $2::INTEGER[]) AS scores(username, score)
+                WHERE known_users.username = scores.username
+            ''', usernames, scores, model_version)
+            return int(result.split()[-1])
+
     async def remove_known_user(self, username: str) -> bool:
         """Remove known user"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('remove_known_user') as conn:
             result = await conn.execute('DELETE FROM known_users WHERE username = $1', username)
             return result != 'DELETE 0'
 
+    # Shared cache methods
+    async def get_shared_predictions(self, usernames: List[str], model_version: Optional[str]) -> List[asyncpg.Record]:
+        """Get unexpired predictions of the current model for many lowercase usernames at once"""
+        async with self.acquire('get_shared_predictions') as conn:
+            return await conn.fetch('''
+                SELECT username, confidence FROM shared_predictions
+                WHERE username = ANY($1::VARCHAR[]) AND expires_at > CURRENT_TIMESTAMP
+                AND model_version IS NOT DISTINCT FROM $2
+            ''', usernames, model_version)
+
+    async def get_shared_users(self, usernames: List[str]) -> List[asyncpg.Record]:
+        """Get unexpired resolved users for many lowercase usernames at once"""
+        async with self.acquire('get_shared_users') as conn:
+            return await conn.fetch('''
+                SELECT username, user_id, login, created_at FROM shared_users
+                WHERE username = ANY($1::VARCHAR[]) AND expires_at > CURRENT_TIMESTAMP
+            ''', usernames)
+
+    async def upsert_shared_predictions(self, usernames: List[str], confidences: List[float],
+                                        model_version: Optional[str], ttl: float):
+        """Bulk insert or refresh predictions, expiring ttl seconds from now"""
+        async with self.acquire('upsert_shared_predictions') as conn:
+            await conn.execute('''
+                INSERT INTO shared_predictions (username, confidence, model_version, expires_at)
+                SELECT username, confidence, $3, CURRENT_TIMESTAMP + make_interval(secs => $4)
+                FROM unnest($1::VARCHAR[], $2::REAL[]) AS entries(username, confidence)
+                ON CONFLICT (username) DO UPDATE SET
+                    confidence = EXCLUDED.confidence,
+                    model_version = EXCLUDED.model_version,
+                    expires_at = EXCLUDED.expires_at
+            ''', usernames, confidences, model_version, ttl)
+
+    async def upsert_shared_users(self, usernames: List[str], user_ids: List[str], logins: List[str],
+                                  created_at: List[datetime], ttl: float):
+        """Bulk insert or refresh resolved users, expiring ttl seconds from now"""
+        async with self.acquire('upsert_shared_users') as conn:
+            await conn.execute('''
+                INSERT INTO shared_users (username, user_id, login, created_at, expires_at)
+                SELECT username, user_id, login, created_at, CURRENT_TIMESTAMP + make_interval(secs => $5)
+                FROM unnest($1::VARCHAR[], $2::VARCHAR[], $3::VARCHAR[], $4::TIMESTAMPTZ[])
+                    AS entries(username, user_id, login, created_at)
+                ON CONFLICT (username) DO UPDATE SET
+                    user_id = EXCLUDED.user_id,
+                    login = EXCLUDED.login,
+                    created_at = EXCLUDED.created_at,
+                    expires_at = EXCLUDED.expires_at
+            ''', usernames, user_ids, logins, created_at, ttl)
+
+    async def delete_expired_shared_entries(self) -> int:
+        """Delete expired shared cache rows and return how many were removed"""
+        async with self.acquire('delete_expired_shared_entries') as conn:
+            deleted = 0
+            for table in ('shared_predictions', 'shared_users'):
+                result = await conn.execute(f'DELETE FROM {table} WHERE expires_at <= CURRENT_TIMESTAMP')
+                deleted += int(result.split()[-1])
+            return deleted
+
+    # Decision log methods
+    async def ensure_decision_partition(self, conn, day: date):
+        """Create the decisions partition for the given UTC day if it does not exist yet"""
+        name = f'decisions_{day:%Y%m%d}'
+        if name in self.decision_partitions:
+            return
+        await conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF decisions
+            FOR VALUES FROM ('{day:%Y-%m-%d} 00:00:00+00') TO ('{day + timedelta(days=1):%Y-%m-%d} 00:00:00+00')
+        ''')
+        self.decision_partitions.add(name)
+
+    async def write_decisions(self, records: List[tuple]):
+        """Copy a batch of (decided_at, channel_id, username, stage, confidence, latency_ms, action) rows"""
+        async with self.acquire('write_decisions') as conn:
+            for day in {record[0].astimezone(timezone.utc).date() for record in records}:
+                await self.ensure_decision_partition(conn, day)
+            await conn.copy_records_to_table(
+                'decisions',
+                records=records,
+                columns=['decided_at', 'channel_id', 'username', 'stage', 'confidence', 'latency_ms', 'action']
+            )
+
+    async def drop_old_decision_partitions(self, retention_days: int) -> List[str]:
+        """Drop decision partitions that are older than the retention period"""
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=retention_days)
+        dropped = []
+        async with self.acquire('drop_old_decision_partitions') as conn:
+            rows = await conn.fetch('''
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'decisions'
+            ''')
+            for row in rows:
+                match = re.fullmatch(r'decisions_(\d{8})', row['relname'])
+                if match and datetime.strptime(match.group(1), '%Y%m%d').date() < cutoff:
+                    await conn.execute(f'DROP TABLE IF EXISTS {row["relname"]}')
+                    self.decision_partitions.discard(row['relname'])
+                    dropped.append(row['relname'])
+        return dropped
+
+    async def get_decision_counts(self, channel_id: str, since: datetime) -> Dict[str, int]:
+        """Count decisions per action for a channel since the given time"""
+        async with self.acquire('get_decision_counts') as conn:
+            rows = await conn.fetch('''
+                SELECT action, count(*) AS total FROM decisions
+                WHERE channel_id = $1 AND decided_at >= $2
+                GROUP BY action
+            ''', str(channel_id), since)
+            return {row['action']: row['total'] for row in rows}
+
+    async def get_stage_latencies(self, channel_id: str, since: datetime) -> Dict[str, Dict[str, float]]:
+        """Return decision count and p50/p95 latency in ms per stage for a channel since the given time"""
+        async with self.acquire('get_stage_latencies') as conn:
+            rows = await conn.fetch('''
+                SELECT stage, count(*) AS total,
+                    percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) AS p50,
+                    percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) AS p95
+                FROM decisions
+                WHERE channel_id = $1 AND decided_at >= $2
+                GROUP BY stage
+            ''', str(channel_id), since)
+            return {row['stage']: {'count': row['total'], 'p50_ms': row['p50'], 'p95_ms': row['p95']} for row in rows}
+
+    async def get_recent_decisions(self, channel_id: str, action: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the latest decisions for a channel, optionally only those with the given action"""
+        async with self.acquire('get_recent_decisions') as conn:
+            rows = await conn.fetch('''
+                SELECT decided_at, username, stage, confidence, latency_ms, action FROM decisions
+                WHERE channel_id = $1 AND ($2::VARCHAR IS NULL OR action = $2)
+                ORDER BY decided_at DESC LIMIT $3
+            ''', str(channel_id), action, limit)
+            return [dict(row) for row in rows]
+
     # Settings methods
     async def get_setting(self, key: str) -> Optional[str]:
         """Get a setting value by key"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('get_setting') as conn:
             row = await conn.fetchrow('SELECT value FROM settings WHERE key = $1', key)
             return row['value'] if row else None
 
     async def set_setting(self, key: str, value: str) -> bool:
         """Set a setting value"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('set_setting') as conn:
             await conn.execute('''
                 INSERT INTO settings (key, value) VALUES ($1, $2)
                 ON CONFLICT (key) DO UPDATE SET
@@ -234,7 +500,7 @@ class DatabaseManager:
 
     async def increment_pat_counter(self) -> int:
         """Increment pat counter and return new value"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire('increment_pat_counter') as conn:
             async with conn.transaction():
                 current = await self.get_pat_counter()
                 new_value = current + 1
@@ -244,15 +510,20 @@ class DatabaseManager:
     # Helper methods for database integration
     async def is_whitelisted(self, username: str) -> bool:
         """Check if username is in whitelist"""
-        whitelist = await self.get_whitelist()
-        return username.lower() in [name.lower() for name in whitelist]
+        async with self.acquire('is_whitelisted') as conn:
+            statement = await self.statement(conn, 'is_whitelisted')
+            return await statement.fetchval(username) is not None
 
     async def is_blacklisted(self, username: str) -> bool:
         """Check if username is in blacklist"""
-        blacklist = await self.get_blacklist()
-        return username.lower() in [name.lower() for name in blacklist]
+        async with self.acquire('is_blacklisted') as conn:
+            statement = await self.statement(conn, 'is_blacklisted')
+            return await statement.fetchval(username) is not None
 
     async def is_known_user(self, username: str) -> bool:
-        """Check if username is a known user"""
-        known_users = await self.get_known_users()
-        return username.lower() in [name.lower() for name in known_users.keys()]
+        """Check if username is a known user, only asking the database if the index reports a possible hit"""
+        if not self.known_user_index.might_contain(username):
+            return False
+        async with self.acquire('is_known_user') as conn:
+            statement = await self.statement(conn, 'is_known_user')
+            return await statement.fetchval(username) is not None
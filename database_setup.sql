@@ -8,66 +8,17 @@ CREATE DATABASE streamer_shield;
 CREATE USER streamer_shield_user WITH PASSWORD 'your_secure_password_here';
 GRANT ALL PRIVILEGES ON DATABASE streamer_shield TO streamer_shield_user;
 
--- 3. Connect to the streamer_shield database and create tables
+-- 3. Connect to the streamer_shield database and allow the application user to create the schema
 \c streamer_shield;
 
--- Create whitelist table
-CREATE TABLE whitelist (
-    id SERIAL PRIMARY KEY,
-    username VARCHAR(255) UNIQUE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+GRANT ALL ON SCHEMA public TO streamer_shield_user;
 
--- Create blacklist table
-CREATE TABLE blacklist (
-    id SERIAL PRIMARY KEY,
-    username VARCHAR(255) UNIQUE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+-- Tables and indexes are created by the versioned migrations in migrations.py.
+-- They are applied automatically when the bot starts, or without starting the bot with:
+--   python migrations.py
+-- The applied versions are recorded in the schema_migrations table.
 
--- Create joinable channels table
-CREATE TABLE joinable_channels (
-    id SERIAL PRIMARY KEY,
-    channel_name VARCHAR(255) UNIQUE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- Create known users table
-CREATE TABLE known_users (
-    id SERIAL PRIMARY KEY,
-    username VARCHAR(255) UNIQUE,
-    confidence_score INTEGER,
-    account_age_years INTEGER,
-    account_age_months INTEGER,
-    account_age_days INTEGER,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- Create settings table for misc data like pat counter
-CREATE TABLE settings (
-    id SERIAL PRIMARY KEY,
-    key VARCHAR(255) UNIQUE NOT NULL,
-    value TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- Initialize pat counter
-INSERT INTO settings (key, value) VALUES ('pat_counter', '0');
-
--- Grant permissions to the application user (if created)
-GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO streamer_shield_user;
-GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO streamer_shield_user;
-
--- Create indexes for better performance
-CREATE INDEX idx_whitelist_username ON whitelist(username);
-CREATE INDEX idx_blacklist_username ON blacklist(username);
-CREATE INDEX idx_channels_name ON joinable_channels(channel_name);
-CREATE INDEX idx_known_users_username ON known_users(username);
-CREATE INDEX idx_settings_key ON settings(key);
-
--- Optional: Migrate existing JSON data
+-- Optional: Migrate existing JSON data (after the migrations have been applied)
 -- You can run these INSERT statements to migrate your existing data from JSON files
 
 -- Example migration from whitelist.json:
@@ -0,0 +1,83 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+from logger import Logger
+
+
+class DecisionLog:
+    """Buffers moderation decisions in memory and writes them to the decisions table in batches.
+
+    record() only appends to a list, a background task copies the buffer into the database
+    every flush_interval seconds or as soon as batch_size decisions are waiting.
+    """
+
+    def __init__(self, db_manager, logger: Logger, flush_interval: float = 5.0, batch_size: int = 500,
+                 max_buffer: int = 100000, retention_days: int = 30):
+        self.db_manager = db_manager
+        self.l = logger
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.buffer: list = []
+        self.dropped = 0
+        self.written = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.running = False
+        self.last_retention = 0.0
+
+    def record(self, channel_id, username: str, stage: str, action: str, confidence: float = None, started: float = None):
+        """Append a decision, started is the time.perf_counter() value from when the check began"""
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        latency_ms = (time.perf_counter() - started) * 1000 if started is not None else None
+        self.buffer.append((datetime.now(timezone.utc), str(channel_id), username, stage, confidence, latency_ms, action))
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+
+    def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+            if not self.running:
+                break
+            if time.monotonic() - self.last_retention > 3600:
+                self.last_retention = time.monotonic()
+                try:
+                    dropped = await self.db_manager.drop_old_decision_partitions(self.retention_days)
+                    if dropped:
+                        self.l.info(f"Dropped decision partitions {', '.join(dropped)}")
+                except Exception as e:
+                    self.l.error(f"Failed to apply decision retention: {e}")
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await self.db_manager.write_decisions(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.l.error(f"Failed to write {len(batch)} decisions: {e}")
+            # keep the batch for the next attempt as long as it fits into the buffer
+            space = self.max_buffer - len(self.buffer)
+            self.dropped += max(0, len(batch) - space)
+            self.buffer = batch[:space] + self.buffer
+
+    async def stop(self):
+        # let the running flush finish instead of cancelling it halfway through a batch
+        self.running = False
+        self.wakeup.set()
+        if self.task:
+            await self.task
+        await self.flush()
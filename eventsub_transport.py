@@ -0,0 +1,94 @@
+import asyncio
+from logger import Logger
+from twitchAPI.twitch import Twitch
+
+
+class EventSubShard:
+    def __init__(self, client):
+        self.client = client
+        self.subscriptions = 0
+
+
+class FollowEventSub:
+    """Channel follow subscriptions over the EventSub webhook or over sharded EventSub WebSockets.
+
+    With the websocket transport a new connection is opened whenever the existing ones reached
+    their subscription limit. Reconnects and session_reconnect messages are handled by each
+    EventSubWebsocket, which keeps its subscriptions, so nothing has to be re-subscribed on our side.
+    """
+
+    def __init__(self, config, twitch: Twitch, logger: Logger, callback_loop: asyncio.AbstractEventLoop = None, revocation_handler = None):
+        self.twitch = twitch
+        self.l = logger
+        self.transport = config.eventsub_transport
+        self.eventsub_url = config.eventsub_url
+        self.ws_url = config.eventsub_ws_url or None
+        self.ws_subscription_url = config.eventsub_ws_subscription_url or None
+        self.shard_size = config.eventsub_ws_shard_size
+        self.max_shards = config.eventsub_ws_max_shards
+        self.callback_loop = callback_loop
+        self.revocation_handler = revocation_handler
+        self.shards: list[EventSubShard] = []
+        self.subscribed: dict = {}
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        if self.transport == 'websocket':
+            # shards are opened on demand, websocket subscriptions do not outlive their session
+            self.l.info("Using EventSub websocket transport")
+            return
+        from twitchAPI.eventsub.webhook import EventSubWebhook
+        webhook = EventSubWebhook(self.eventsub_url, 8080, self.twitch, callback_loop=self.callback_loop, revocation_handler=self.revocation_handler)
+        await webhook.unsubscribe_all() # unsub, otherwise stuff breaks
+        webhook.start()
+        self.shards.append(EventSubShard(webhook))
+        self.l.info("Using EventSub webhook transport")
+
+    async def open_shard(self) -> EventSubShard:
+        if len(self.shards) >= self.max_shards:
+            raise RuntimeError(f'All {self.max_shards} EventSub websocket connections are full')
+        from twitchAPI.eventsub.websocket import EventSubWebsocket
+        client = EventSubWebsocket(self.twitch,
+                                   connection_url=self.ws_url,
+                                   subscription_url=self.ws_subscription_url,
+                                   callback_loop=self.callback_loop,
+                                   revocation_handler=self.revocation_handler)
+        # start() blocks until the welcome message arrived, keep that off the event loop
+        await asyncio.to_thread(client.start)
+        shard = EventSubShard(client)
+        self.shards.append(shard)
+        self.l.passing(f"Opened EventSub websocket shard {len(self.shards)}")
+        return shard
+
+    async def get_shard(self) -> EventSubShard:
+        for shard in self.shards:
+            if self.transport != 'websocket' or shard.subscriptions < self.shard_size:
+                return shard
+        return await self.open_shard()
+
+    async def listen_channel_follow_v2(self, broadcaster_user_id: str, moderator_user_id: str, callback):
+        async with self.lock:
+            if broadcaster_user_id in self.subscribed:
+                return
+            shard = await self.get_shard()
+            topic_id = await shard.client.listen_channel_follow_v2(broadcaster_user_id, moderator_user_id, callback)
+            shard.subscriptions += 1
+            self.subscribed[broadcaster_user_id] = (shard, topic_id)
+
+    async def unsubscribe(self, broadcaster_user_id: str):
+        async with self.lock:
+            entry = self.subscribed.pop(broadcaster_user_id, None)
+            if entry is None:
+                return
+            shard, topic_id = entry
+            shard.subscriptions -= 1
+            await shard.client.unsubscribe_topic(topic_id)
+
+    async def stop(self):
+        for shard in self.shards:
+            try:
+                await shard.client.stop()
+            except Exception as e:
+                self.l.error(f"Error whilst stopping EventSub: {e}")
+        self.shards = []
+        self.subscribed = {}
@@ -0,0 +1,36 @@
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Bounded set of event keys seen within the last window seconds.
+
+    Keys expire a fixed time after they were first seen, so the oldest entries are always at the front.
+    """
+
+    def __init__(self, window: float = 60, max_entries: int = 100000):
+        self.window = window
+        self.max_entries = max_entries
+        self.seen: OrderedDict = OrderedDict()
+        self.dropped: dict = {}
+        self.passed = 0
+
+    def is_duplicate(self, key, kind: str) -> bool:
+        """Return True if the key was seen within the window, otherwise remember it"""
+        now = time.monotonic()
+        while self.seen:
+            oldest, seen_at = next(iter(self.seen.items()))
+            if now - seen_at <= self.window:
+                break
+            self.seen.popitem(last=False)
+        if key in self.seen:
+            self.dropped[kind] = self.dropped.get(kind, 0) + 1
+            return True
+        self.seen[key] = now
+        if len(self.seen) > self.max_entries:
+            self.seen.popitem(last=False)
+        self.passed += 1
+        return False
+
+    def stats(self) -> dict:
+        return {'entries': len(self.seen), 'passed': self.passed, 'dropped': dict(self.dropped)}
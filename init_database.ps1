@@ -15,10 +15,11 @@ psql -h $env:DB_HOST -p $env:DB_PORT -U $env:DB_ADMIN_USER -c "CREATE DATABASE $
 psql -h $env:DB_HOST -p $env:DB_PORT -U $env:DB_ADMIN_USER -c "CREATE USER $env:DB_USER WITH PASSWORD '$env:DB_PASSWORD';"
 psql -h $env:DB_HOST -p $env:DB_PORT -U $env:DB_ADMIN_USER -c "GRANT ALL PRIVILEGES ON DATABASE $env:DB_NAME TO $env:DB_USER;"
 
-# Create tables and indexes
-psql -h $env:DB_HOST -p $env:DB_PORT -U $env:DB_USER -d $env:DB_NAME -f database_setup.sql
+# Allow the application user to create the schema
+psql -h $env:DB_HOST -p $env:DB_PORT -U $env:DB_ADMIN_USER -d $env:DB_NAME -c "GRANT ALL ON SCHEMA public TO $env:DB_USER;"
 
 Write-Host "Database initialization complete!"
+Write-Host "Tables and indexes are created by the bot on its first start (or with: python migrations.py)"
 
 # Required environment variables for the services
 Write-Host "Set these environment variables before running the services:"
@@ -25,11 +25,12 @@ psql -h $DB_HOST -p $DB_PORT -U $DB_ADMIN_USER -c "CREATE USER ${DB_USER} WITH P
 psql -h $DB_HOST -p $DB_PORT -U $DB_ADMIN_USER -c "GRANT ALL PRIVILEGES ON DATABASE $DB_NAME TO $DB_USER;"
 
 # Run the database setup SQL
-echo "Creating tables and indexes..."
-psql -h $DB_HOST -p $DB_PORT -U $DB_USER -d $DB_NAME -f database_setup.sql
+echo "Preparing schema permissions..."
+psql -h $DB_HOST -p $DB_PORT -U $DB_ADMIN_USER -d $DB_NAME -c "GRANT ALL ON SCHEMA public TO $DB_USER;"
 
 echo "Database initialization complete!"
 echo ""
+echo "Tables and indexes are created by the bot on its first start (or with: python migrations.py)"
 echo "To migrate existing JSON data, you can run the migration commands in database_setup.sql"
 echo "Make sure to set the following environment variables before running the services:"
 echo "export TWITCH_APP_ID='your_twitch_app_id'"
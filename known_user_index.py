@@ -0,0 +1,50 @@
+import math
+import hashlib
+
+
+class KnownUserIndex:
+    """Bloom filter over known usernames, sized for a fixed capacity so memory stays bounded"""
+
+    def __init__(self, capacity: int = 5_000_000, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.ready = False
+        self.negatives = 0
+        self.positives = 0
+
+    def _positions(self, name: str):
+        digest = hashlib.blake2b(name.lower().encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, name: str):
+        """Add a username to the index"""
+        for position in self._positions(name):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, name: str) -> bool:
+        """False means the user is definitely unknown, True has to be confirmed against the database"""
+        if not self.ready:
+            return True
+        for position in self._positions(name):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                self.negatives += 1
+                return False
+        self.positives += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'entries': self.count,
+            'capacity': self.capacity,
+            'bytes': len(self.bits),
+            'negatives': self.negatives,
+            'positives': self.positives
+        }
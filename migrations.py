@@ -0,0 +1,219 @@
+import re
+import asyncio
+from typing import List, NamedTuple
+from logger import Logger
+
+# advisory lock keys, one for the blocking migrations on boot and one for online index builds
+MIGRATION_LOCK_KEY = 72_617_001
+ONLINE_MIGRATION_LOCK_KEY = 72_617_002
+# CREATE INDEX CONCURRENTLY on a large table can take far longer than the pool's command timeout
+ONLINE_STATEMENT_TIMEOUT = 24 * 3600
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: List[str]
+    # online migrations only build indexes CONCURRENTLY, run outside a transaction after boot and must
+    # not be required by any later blocking migration
+    online: bool = False
+
+
+MIGRATIONS = [
+    Migration(1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS whitelist (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(255) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS blacklist (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(255) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS joinable_channels (
+            id SERIAL PRIMARY KEY,
+            channel_name VARCHAR(255) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS known_users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(255) UNIQUE,
+            confidence_score INTEGER,
+            account_age_years INTEGER,
+            account_age_months INTEGER,
+            account_age_days INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            id SERIAL PRIMARY KEY,
+            key VARCHAR(255) UNIQUE NOT NULL,
+            value TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_whitelist_username ON whitelist(username)',
+        'CREATE INDEX IF NOT EXISTS idx_blacklist_username ON blacklist(username)',
+        'CREATE INDEX IF NOT EXISTS idx_channels_name ON joinable_channels(channel_name)',
+        'CREATE INDEX IF NOT EXISTS idx_known_users_username ON known_users(username)',
+        'CREATE INDEX IF NOT EXISTS idx_settings_key ON settings(key)',
+        '''
+        INSERT INTO settings (key, value) VALUES ('pat_counter', '0')
+        ON CONFLICT (key) DO NOTHING
+        '''
+    ]),
+    Migration(2, 'model version of known user scores', [
+        'ALTER TABLE known_users ADD COLUMN IF NOT EXISTS model_version VARCHAR(64)'
+    ]),
+    Migration(3, 'moderation decision log', [
+        '''
+        CREATE TABLE IF NOT EXISTS decisions (
+            decided_at TIMESTAMPTZ NOT NULL,
+            channel_id VARCHAR(255),
+            username VARCHAR(255) NOT NULL,
+            stage VARCHAR(32) NOT NULL,
+            confidence REAL,
+            latency_ms REAL,
+            action VARCHAR(32) NOT NULL
+        ) PARTITION BY RANGE (decided_at)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_decisions_channel ON decisions(channel_id, decided_at)',
+        'CREATE INDEX IF NOT EXISTS idx_decisions_username ON decisions(username, decided_at)'
+    ]),
+    Migration(4, 'case-insensitive username indexes', [
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_whitelist_username_lower ON whitelist(lower(username))',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_blacklist_username_lower ON blacklist(lower(username))',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_known_users_username_lower ON known_users(lower(username))'
+    ], online=True),
+    Migration(5, 'shared prediction and user cache', [
+        # UNLOGGED skips the WAL, the tables are emptied after a crash which only costs cache misses
+        '''
+        CREATE UNLOGGED TABLE IF NOT EXISTS shared_predictions (
+            username VARCHAR(255) PRIMARY KEY,
+            confidence REAL NOT NULL,
+            model_version VARCHAR(64),
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        ''',
+        '''
+        CREATE UNLOGGED TABLE IF NOT EXISTS shared_users (
+            username VARCHAR(255) PRIMARY KEY,
+            user_id VARCHAR(64) NOT NULL,
+            login VARCHAR(255) NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL,
+            expires_at TIMESTAMPTZ NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_shared_predictions_expires ON shared_predictions(expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_shared_users_expires ON shared_users(expires_at)'
+    ])
+]
+
+
+class MigrationRunner:
+    """Applies pending MIGRATIONS and records them in schema_migrations.
+
+    Blocking migrations run on boot, each in its own transaction, under an advisory lock so that
+    several workers can start at the same time. Online migrations are returned by run() and built
+    afterwards by run_online(), so large tables get new indexes without locking writes or delaying boot.
+    """
+
+    def __init__(self, pool, logger: Logger, migrations: List[Migration] = MIGRATIONS):
+        self.pool = pool
+        self.l = logger
+        self.migrations = migrations
+
+    async def applied_versions(self, conn) -> set:
+        return {row['version'] for row in await conn.fetch('SELECT version FROM schema_migrations')}
+
+    async def record(self, conn, migration: Migration):
+        await conn.execute('INSERT INTO schema_migrations (version, description) VALUES ($1, $2)',
+                           migration.version, migration.description)
+
+    async def run(self) -> List[Migration]:
+        """Apply pending blocking migrations and return the pending online ones"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_KEY)
+            try:
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT,
+                        applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                applied = await self.applied_versions(conn)
+                for migration in self.migrations:
+                    if migration.online or migration.version in applied:
+                        continue
+                    async with conn.transaction():
+                        for statement in migration.statements:
+                            await conn.execute(statement)
+                        await self.record(conn, migration)
+                    self.l.passing(f"Applied migration {migration.version}: {migration.description}")
+            finally:
+                await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+        return [m for m in self.migrations if m.online and m.version not in applied]
+
+    async def run_online(self, migrations: List[Migration]):
+        """Build the indexes of online migrations, skipped if another worker is already at it"""
+        if not migrations:
+            return
+        async with self.pool.acquire() as conn:
+            if not await conn.fetchval('SELECT pg_try_advisory_lock($1)', ONLINE_MIGRATION_LOCK_KEY):
+                self.l.info("Online migrations are run by another worker")
+                return
+            try:
+                applied = await self.applied_versions(conn)
+                for migration in migrations:
+                    if migration.version in applied:
+                        continue
+                    self.l.info(f"Building migration {migration.version} online: {migration.description}")
+                    for statement in migration.statements:
+                        await self.drop_invalid_index(conn, statement)
+                        await conn.execute(statement, timeout=ONLINE_STATEMENT_TIMEOUT)
+                    await self.record(conn, migration)
+                    self.l.passing(f"Applied migration {migration.version}: {migration.description}")
+            finally:
+                await conn.execute('SELECT pg_advisory_unlock($1)', ONLINE_MIGRATION_LOCK_KEY)
+
+    async def drop_invalid_index(self, conn, statement: str):
+        # an interrupted concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+        match = re.search(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', statement, re.IGNORECASE)
+        if not match:
+            return
+        invalid = await conn.fetchval('''
+            SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+            WHERE pg_class.relname = $1 AND NOT pg_index.indisvalid
+        ''', match.group(1))
+        if invalid:
+            self.l.warning(f"Dropping invalid index {match.group(1)} left by an interrupted build")
+            await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}', timeout=ONLINE_STATEMENT_TIMEOUT)
+
+
+if __name__ == "__main__":
+    # applies all migrations, including the online ones, without starting the bot
+    from twitch_config import TwitchConfig
+    from database_manager import DatabaseManager
+
+    async def main():
+        db_manager = DatabaseManager(TwitchConfig())
+        await db_manager.initialize_pool()
+        try:
+            runner = MigrationRunner(db_manager.pool, db_manager.logger)
+            await runner.run_online(await runner.run())
+        finally:
+            await db_manager.close_pool()
+
+    asyncio.run(main())
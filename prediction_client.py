@@ -0,0 +1,51 @@
+import asyncio
+from typing import Dict, List, Optional
+from logger import Logger
+
+
+class PredictionClient:
+    """Async client for the StreamerShield prediction endpoint, sharing one HTTP session"""
+
+    def __init__(self, url: str, logger: Logger, timeout: float = 10, concurrency: int = 64):
+        self.url = url
+        self.l = logger
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.session = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            import aiohttp
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.concurrency)
+            )
+        return self.session
+
+    async def predict(self, name: str) -> Optional[float]:
+        """Return the scam confidence of a username times 1000, or None if the request failed"""
+        session = await self.get_session()
+        async with session.post(self.url, json={"input_string": name}) as response:
+            if response.status == 200:
+                return (await response.json())["result"]
+            self.l.error(f'Prediction for {name} failed with {response.status}: {await response.text()}')
+            return None
+
+    async def predict_many(self, names: List[str]) -> Dict[str, Optional[float]]:
+        """Predict many usernames concurrently, failed requests map to None"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def predict_one(name: str):
+            async with semaphore:
+                try:
+                    return await self.predict(name)
+                except Exception as e:
+                    self.l.error(f'Prediction for {name} failed: {e}')
+                    return None
+
+        results = await asyncio.gather(*(predict_one(name) for name in names))
+        return dict(zip(names, results))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import functools
+import itertools
+import threading
+import contextvars
+from typing import Optional
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread.
+
+    Stacks are aggregated in the folded format ('outer;inner;leaf count') that
+    flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: dict = {}
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.target = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, thread_id: Optional[int] = None):
+        """Start sampling the given thread, by default the calling one"""
+        self.target = thread_id or threading.get_ident()
+        self.samples = {}
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.thread = None
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.items():
+                f.write(f'{stack} {count}\n')
+
+
+class Span:
+    def __init__(self, tracer: 'Tracer', name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.id = next(self.tracer.ids)
+        self.parent = self.tracer.current.get()
+        self.token = self.tracer.current.set(self.id)
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        self.tracer.current.reset(self.token)
+        self.tracer.emit({
+            'name': self.name,
+            'id': self.id,
+            'parent': self.parent,
+            'start': self.start,
+            'duration_ms': round(duration * 1000, 3),
+            'error': exc_type.__name__ if exc_type else None,
+            **self.attributes
+        })
+        return False
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """Per event trace spans written as JSON lines, nesting follows the asyncio task context.
+
+    While tracing is off span() returns a shared no-op context manager.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.file = None
+        self.buffer: list = []
+        self.ids = itertools.count(1)
+        self.current = contextvars.ContextVar('trace_span', default=None)
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attributes)
+
+    def emit(self, record: dict):
+        self.buffer.append(json.dumps(record, default=str))
+        if len(self.buffer) >= 1000:
+            self.flush()
+
+    def flush(self):
+        if self.file and self.buffer:
+            self.file.write('\n'.join(self.buffer) + '\n')
+            self.file.flush()
+        self.buffer = []
+
+    def start(self, path: str):
+        self.file = open(path, 'w')
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        self.flush()
+        if self.file:
+            self.file.close()
+        self.file = None
+
+
+tracer = Tracer()
+
+
+class PhaseTimer:
+    """Collects the duration of named startup phases, phases may overlap when they run concurrently"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: list = []
+
+    async def measure(self, name: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases.append((name, start - self.started, time.perf_counter() - start))
+
+    def add(self, name: str, start: float, end: float):
+        """Record a phase from two time.perf_counter() values"""
+        self.phases.append((name, start - self.started, end - start))
+
+    def report(self) -> list:
+        return [f'{name}: {duration * 1000:.0f}ms (at +{offset * 1000:.0f}ms)' for name, offset, duration in sorted(self.phases, key=lambda p: p[1])]
+
+
+def traced(name: str):
+    """Decorator running a coroutine function inside a span of the given name"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await func(*args, **kwargs)
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
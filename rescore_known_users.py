@@ -0,0 +1,73 @@
+import time
+import math
+import asyncio
+import argparse
+from twitch_config import TwitchConfig
+from database_manager import DatabaseManager
+from prediction_client import PredictionClient
+
+
+async def rescore(config: TwitchConfig, model_version: str, page_size: int, restart: bool, retries: int):
+    """Re-score every known user with the current predictor, resuming from the last checkpoint"""
+    l = config.logger
+    db_manager = DatabaseManager(config)
+    predictor = PredictionClient(config.shield_url, l, config.predictor_timeout, config.predictor_concurrency)
+    checkpoint_key = f'rescore_checkpoint:{model_version}'
+    await db_manager.initialize_pool()
+    try:
+        last_id = 0 if restart else int(await db_manager.get_setting(checkpoint_key) or 0)
+        if last_id:
+            l.info(f"Resuming re-scoring for model {model_version} after id {last_id}")
+        started = time.perf_counter()
+        scored = 0
+        # failed rows by id, the checkpoint never moves past the lowest one so a resumed run retries them
+        failed = {}
+        last_seen = last_id
+
+        async def score(rows: dict) -> int:
+            predictions = await predictor.predict_many(list(rows.values()))
+            usernames = [name for name, conf in predictions.items() if conf is not None]
+            scores = [math.floor(predictions[name]) for name in usernames]
+            await db_manager.update_confidence_scores(usernames, scores, model_version)
+            for row_id, name in rows.items():
+                if predictions[name] is None:
+                    failed[row_id] = name
+                else:
+                    failed.pop(row_id, None)
+            checkpoint = min(failed) - 1 if failed else last_seen
+            await db_manager.set_setting(checkpoint_key, str(checkpoint))
+            return len(usernames)
+
+        # the next page is fetched while the current one is being predicted
+        next_page = asyncio.create_task(db_manager.get_known_users_page(last_id, page_size))
+        while True:
+            page = await next_page
+            if not page:
+                break
+            next_page = asyncio.create_task(db_manager.get_known_users_page(page[-1]['id'], page_size))
+            last_seen = page[-1]['id']
+            page_started = time.perf_counter()
+            scored += await score({row['id']: row['username'] for row in page})
+            l.passing(f"Re-scored up to id {last_seen}: {len(page) / (time.perf_counter() - page_started):.0f} users/s this page, "
+                      f"{scored / (time.perf_counter() - started):.0f} users/s overall, {scored} done, {len(failed)} failed")
+        for attempt in range(1, retries + 1):
+            if not failed:
+                break
+            l.info(f"Retrying {len(failed)} failed users, attempt {attempt} of {retries}")
+            scored += await score(dict(failed))
+        if failed:
+            l.fail(f"Re-scoring for model {model_version} left {len(failed)} users unscored, run it again to retry them")
+        l.passingblue(f"Re-scoring for model {model_version} finished: {scored} users in {time.perf_counter() - started:.1f}s, {len(failed)} failed")
+    finally:
+        await predictor.close()
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Re-score known_users with the current prediction model')
+    parser.add_argument('--model-version', required=True, help='version of the deployed model, stored per row and used as checkpoint key')
+    parser.add_argument('--page-size', type=int, default=5000, help='users fetched, predicted and updated per batch')
+    parser.add_argument('--retries', type=int, default=3, help='rounds of retrying users whose prediction failed before finishing')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from the beginning')
+    args = parser.parse_args()
+    asyncio.run(rescore(TwitchConfig(), args.model_version, args.page_size, args.restart, args.retries))
@@ -0,0 +1,206 @@
+import json
+import time
+import asyncio
+from datetime import timezone
+from typing import Optional
+from logger import Logger
+from shield_state import ShieldState, CachedUser
+
+# NOTIFY channel of list changes that invalidate local caches on every node
+CACHE_CHANNEL = 'shield_cache'
+
+
+class SharedCache:
+    """Prediction and user lookup cache shared by every bot instance on the same database.
+
+    Sits between the local ShieldState and the predictor and Helix. Lookups of concurrent checks are
+    coalesced into one batched read, new entries are upserted in batches in the background, and list
+    changes made by any node arrive through LISTEN/NOTIFY and evict the affected local entries.
+    """
+
+    def __init__(self, db_manager, state: ShieldState, logger: Logger, config):
+        self.db_manager = db_manager
+        self.state = state
+        self.l = logger
+        self.prediction_ttl = config.prediction_cache_ttl
+        self.user_ttl = config.user_cache_ttl
+        self.model_version = config.model_version or None
+        self.flush_interval = config.shared_cache_flush_interval
+        self.read_delay = config.shared_cache_read_delay
+        self.cleanup_interval = config.shared_cache_cleanup_interval
+        self.pending_predictions: dict = {}
+        self.pending_users: dict = {}
+        self.reads: dict = {'predictions': {}, 'users': {}}
+        # the loop only keeps weak references to tasks
+        self.read_tasks: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.invalidations = 0
+        self.wakeup = asyncio.Event()
+        self.running = False
+        self.task = None
+        self.listen_task = None
+
+    def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+        self.listen_task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        self.running = False
+        self.wakeup.set()
+        for task in list(self.read_tasks):
+            task.cancel()
+        if self.listen_task:
+            self.listen_task.cancel()
+            try:
+                await self.listen_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.task:
+            await self.task
+        await self.flush()
+
+    # Reads
+    async def get_prediction(self, name: str) -> Optional[float]:
+        return await self.read('predictions', name)
+
+    async def get_user(self, name: str) -> Optional[CachedUser]:
+        return await self.read('users', name)
+
+    async def read(self, table: str, name: str):
+        key = name.lower()
+        batch = self.reads[table]
+        future = batch.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            batch[key] = future
+            if len(batch) == 1:
+                task = asyncio.create_task(self.read_batch(table))
+                self.read_tasks.add(task)
+                task.add_done_callback(self.read_tasks.discard)
+        result = await future
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def read_batch(self, table: str):
+        batch = self.reads[table]
+        found = {}
+        try:
+            # wait a moment so lookups of the same burst share one query
+            await asyncio.sleep(self.read_delay)
+            self.reads[table] = {}
+            if table == 'predictions':
+                rows = await self.db_manager.get_shared_predictions(list(batch), self.model_version)
+                found = {row['username']: row['confidence'] for row in rows}
+            else:
+                rows = await self.db_manager.get_shared_users(list(batch))
+                found = {row['username']: CachedUser(row['user_id'], row['login'], row['created_at']) for row in rows}
+        except Exception as e:
+            # the shared tier is only an optimization, a failed read falls through to the source
+            self.l.error(f"Failed to read {len(batch)} shared cache {table}: {e}")
+        finally:
+            if self.reads[table] is batch:
+                self.reads[table] = {}
+            # also resolves the batch when the task is cancelled, so no lookup waits forever
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(found.get(key))
+
+    # Writes
+    def put_prediction(self, name: str, conf: float):
+        self.pending_predictions[name.lower()] = conf
+
+    def put_user(self, name: str, user):
+        self.pending_users[name.lower()] = (str(user.id), user.login, user.created_at.astimezone(timezone.utc))
+
+    async def run(self):
+        last_cleanup = time.monotonic()
+        while self.running:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+            if self.running and time.monotonic() - last_cleanup > self.cleanup_interval:
+                last_cleanup = time.monotonic()
+                try:
+                    await self.db_manager.delete_expired_shared_entries()
+                except Exception as e:
+                    self.l.error(f"Failed to delete expired shared cache entries: {e}")
+
+    async def flush(self):
+        predictions, self.pending_predictions = self.pending_predictions, {}
+        users, self.pending_users = self.pending_users, {}
+        try:
+            if predictions:
+                await self.db_manager.upsert_shared_predictions(
+                    list(predictions), list(predictions.values()), self.model_version, self.prediction_ttl)
+                self.written += len(predictions)
+            if users:
+                await self.db_manager.upsert_shared_users(
+                    list(users), [u[0] for u in users.values()], [u[1] for u in users.values()],
+                    [u[2] for u in users.values()], self.user_ttl)
+                self.written += len(users)
+        except Exception as e:
+            # entries are recomputed by whichever node sees the user next, so a failed batch is dropped
+            self.l.error(f"Failed to write {len(predictions) + len(users)} shared cache entries: {e}")
+
+    # Invalidations
+    async def listen(self):
+        connected_before = False
+        while self.running:
+            closed = asyncio.Event()
+            try:
+                conn = await self.db_manager.connect()
+            except Exception as e:
+                self.l.error(f"Failed to connect the shared cache listener: {e}")
+                await asyncio.sleep(5)
+                continue
+            try:
+                conn.add_termination_listener(lambda _: closed.set())
+                await conn.add_listener(CACHE_CHANNEL, self.on_notification)
+                if connected_before:
+                    # notifications sent while disconnected are lost, so resync what they would have changed
+                    self.l.warning("Shared cache listener reconnected, reloading the blacklist prefilter")
+                    self.state.forget_all()
+                    await self.db_manager.load_blacklist_prefilter()
+                connected_before = True
+                await closed.wait()
+                self.l.warning("Shared cache listener lost its connection")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+
+    def on_notification(self, conn, pid, channel: str, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            self.l.error(f"Ignoring malformed shared cache notification: {payload}")
+            return
+        if message.get('node') == self.db_manager.node_id:
+            return
+        self.invalidations += 1
+        name = message['username']
+        kind = message['kind']
+        if kind == 'blacklist':
+            self.db_manager.blacklist_prefilter.add(name)
+            self.state.forget(name)
+        elif kind == 'unblacklist':
+            self.db_manager.blacklist_prefilter.remove(name)
+        elif kind == 'unwhitelist':
+            self.state.forget(name)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'written': self.written,
+            'pending': len(self.pending_predictions) + len(self.pending_users),
+            'invalidations': self.invalidations
+        }
@@ -0,0 +1,152 @@
+import os
+import time
+import zlib
+import struct
+import marshal
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+SNAPSHOT_MAGIC = b'SSHS'
+SNAPSHOT_VERSION = 1
+# magic, snapshot format version, marshal format version, creation time
+SNAPSHOT_HEADER = struct.Struct('<4sHHd')
+
+
+class CachedUser(NamedTuple):
+    """The parts of a TwitchUser that check_user needs"""
+    id: str
+    login: str
+    created_at: datetime
+
+
+class ShieldState:
+    """Hot in-process state of the shield: predictions, resolved users and cleared chatters per room.
+
+    Every entry carries the wall clock time it was stored at, so it can expire and survive a restart
+    through save() and load(). Predictions are only restored if they were made by the same model version.
+    """
+
+    def __init__(self, prediction_ttl: float = 86400, user_ttl: float = 604800, cleared_ttl: float = 86400, max_entries: int = 1000000,
+                 model_version: Optional[str] = None):
+        self.prediction_ttl = prediction_ttl
+        self.user_ttl = user_ttl
+        self.cleared_ttl = cleared_ttl
+        self.max_entries = max_entries
+        self.model_version = model_version
+        self.predictions: dict = {}
+        self.users: dict = {}
+        self.cleared: dict = {}
+
+    def _put(self, table: dict, key, value):
+        table.pop(key, None)
+        table[key] = value
+        if len(table) > self.max_entries:
+            # dicts keep insertion order, so the first key is the oldest entry
+            table.pop(next(iter(table)))
+
+    def get_prediction(self, name: str) -> Optional[float]:
+        entry = self.predictions.get(name.lower())
+        if entry is None:
+            return None
+        if time.time() - entry[1] > self.prediction_ttl:
+            # expired entries are dropped when they are read, snapshots leave the tables alone
+            self.predictions.pop(name.lower(), None)
+            return None
+        return entry[0]
+
+    def put_prediction(self, name: str, conf: float):
+        self._put(self.predictions, name.lower(), (conf, time.time()))
+
+    def get_user(self, name: str) -> Optional[CachedUser]:
+        entry = self.users.get(name.lower())
+        if entry is None:
+            return None
+        if time.time() - entry[3] > self.user_ttl:
+            self.users.pop(name.lower(), None)
+            return None
+        return CachedUser(entry[0], entry[1], datetime.fromtimestamp(entry[2], timezone.utc))
+
+    def put_user(self, name: str, user):
+        self._put(self.users, name.lower(), (str(user.id), user.login, user.created_at.timestamp(), time.time()))
+
+    def is_cleared(self, room, name: str) -> bool:
+        cleared_at = self.cleared.get(str(room), {}).get(name.lower())
+        return cleared_at is not None and time.time() - cleared_at <= self.cleared_ttl
+
+    def clear(self, room, name: str):
+        self._put(self.cleared.setdefault(str(room), {}), name.lower(), time.time())
+
+    def forget(self, name: str):
+        """Drop a user from every cleared set, e.g. after it was blacklisted"""
+        for room in self.cleared.values():
+            room.pop(name.lower(), None)
+
+    def forget_all(self):
+        """Drop every cleared set, e.g. after list changes may have been missed"""
+        self.cleared = {}
+
+    def expired(self, tables: dict, now: float) -> dict:
+        """Return the tables without expired entries, only reads the given tables"""
+        return {
+            'predictions': {k: v for k, v in tables['predictions'].items() if now - v[1] <= self.prediction_ttl},
+            'users': {k: v for k, v in tables['users'].items() if now - v[3] <= self.user_ttl},
+            'cleared': {room: {k: v for k, v in names.items() if now - v <= self.cleared_ttl} for room, names in tables['cleared'].items()}
+        }
+
+    def expire(self):
+        tables = self.expired({'predictions': self.predictions, 'users': self.users, 'cleared': self.cleared}, time.time())
+        self.predictions = tables['predictions']
+        self.users = tables['users']
+        self.cleared = tables['cleared']
+
+    def copy(self) -> dict:
+        """Shallow copy of the tables, cheap enough to take on the thread that modifies the state"""
+        return {
+            'predictions': dict(self.predictions),
+            'users': dict(self.users),
+            'cleared': {room: dict(names) for room, names in self.cleared.items()}
+        }
+
+    def save(self, path: str):
+        self.write(path, self.copy())
+
+    def write(self, path: str, tables: dict):
+        """Write a compressed snapshot of copied tables, replacing the old one atomically. Safe to run in a worker thread"""
+        state = self.expired(tables, time.time())
+        state['model_version'] = self.model_version
+        body = zlib.compress(marshal.dumps(state), 1)
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, marshal.version, time.time())
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(body)
+        os.replace(temp_path, path)
+
+    def load(self, path: str, max_age: float) -> str:
+        """Load a snapshot if it exists, is of the current version and is not older than max_age seconds"""
+        if not os.path.exists(path):
+            return 'no snapshot found'
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < SNAPSHOT_HEADER.size:
+            return 'snapshot is truncated'
+        magic, version, marshal_version, created = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or marshal_version != marshal.version:
+            return 'snapshot has an incompatible version'
+        age = time.time() - created
+        if age > max_age:
+            return f'snapshot is stale ({age:.0f}s old)'
+        state = marshal.loads(zlib.decompress(data[SNAPSHOT_HEADER.size:]))
+        self.predictions = state['predictions']
+        self.users = state['users']
+        self.cleared = state['cleared']
+        self.expire()
+        model_note = ''
+        if state.get('model_version') != self.model_version:
+            # a retrained model scores differently, its predecessor's predictions must not be served
+            model_note = f", dropped {len(self.predictions)} predictions of model {state.get('model_version')}"
+            self.predictions = {}
+        return f'loaded {len(self.predictions)} predictions, {len(self.users)} users and {sum(len(v) for v in self.cleared.values())} cleared chatters ({age:.0f}s old){model_note}'
@@ -0,0 +1,36 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one underlying call.
+
+    The first caller starts the coroutine, callers arriving while it is in flight await the
+    same result. Nothing is kept once the call finished, caching is left to ShieldState.
+    """
+
+    def __init__(self):
+        self.calls: dict = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key, func):
+        task = self.calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            # the call runs as its own task, so cancelling any caller, the first one included,
+            # leaves it running for everyone else
+            task = asyncio.create_task(func())
+            self.calls[key] = task
+            self.started += 1
+            task.add_done_callback(lambda done: self.finished(key, done))
+        return await asyncio.shield(task)
+
+    def finished(self, key, task: asyncio.Task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception() # mark as retrieved, in case every caller was cancelled
+
+    def stats(self) -> dict:
+        return {'in_flight': len(self.calls), 'started': self.started, 'shared': self.shared}
@@ -4,15 +4,14 @@ import json
 import math
 import time
 import asyncio
-import requests
-import threading
-import numpy as np
-from datetime import datetime
+import signal
+import inspect
+from typing import NamedTuple, Optional
+from datetime import datetime, timedelta, timezone
 from twitchAPI.helper import first
 from quart import Quart, redirect, request
 from twitchAPI.oauth import UserAuthenticator
 from twitchAPI.twitch import Twitch, TwitchUser
-from twitchAPI.eventsub.webhook import EventSubWebhook
 from twitchAPI.object.eventsub import ChannelFollowEvent
 from twitchAPI.type import AuthScope, ChatEvent, TwitchAPIException, EventSubSubscriptionConflict, EventSubSubscriptionError, EventSubSubscriptionTimeout, TwitchBackendException
 from twitchAPI.chat import Chat, EventData, ChatMessage, JoinEvent, JoinedEvent, ChatCommand, ChatUser
@@ -21,10 +20,28 @@ from twitchAPI.chat import Chat, EventData, ChatMessage, JoinEvent, JoinedEvent,
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared'))
 from twitch_config import TwitchConfig
 from database_manager import DatabaseManager
+from admin_console import AdminConsole
+from eventsub_transport import FollowEventSub
+from decision_log import DecisionLog
+from shield_state import ShieldState
+from profiler import SamplingProfiler, PhaseTimer, tracer, traced
+from single_flight import SingleFlight
+from prediction_client import PredictionClient
+from chatter_sweep import ChatterSweeper
+from idempotency import IdempotencyCache
+from shared_cache import SharedCache
 
 init_login : bool
 twitch: Twitch
-auth: UserAuthenticator
+auth: UserAuthenticator = None
+
+
+class Verdict(NamedTuple):
+    """Outcome of evaluating a user, shared by every room that checked the user at the same time"""
+    stage: str
+    rule: Optional[str] = None
+    conf: Optional[float] = None
+    user: Optional[TwitchUser] = None
 
 
 async def shield_info_twitch(chat_command: ChatCommand):
@@ -38,7 +55,10 @@ class StreamerShieldTwitch:
     is_armed : bool
     
     def __init__(self, twitch_config : TwitchConfig) -> None:
+        # created after the initial login, shutdown() skips them if it never happened
         self.eventsub = None
+        self.chat = None
+        self.sweeper = None
         self.__app_id = twitch_config.app_id
         self.__app_secret = twitch_config.app_secret
         self.user_scopes = twitch_config.user_scopes
@@ -46,15 +66,33 @@ class StreamerShieldTwitch:
         self.is_armed  = twitch_config.is_armed
         self.ban_reason = twitch_config.ban_reason
         self.l = twitch_config.logger
-        self.await_login = True
+        self.login_event = asyncio.Event()
         self.even_subs = []
         self.auth_url = twitch_config.auth_url
         self.shield_url = twitch_config.shield_url
         self.eventsub_url = twitch_config.eventsub_url
+        self.config = twitch_config
         self.collect_data = twitch_config.collect_data
         self.age_threshold = twitch_config.age_threshold
         self.admin = twitch_config.admin
         self.db_manager = DatabaseManager(twitch_config)
+        self.decisions = DecisionLog(self.db_manager, self.l,
+                                     flush_interval=twitch_config.decision_flush_interval,
+                                     batch_size=twitch_config.decision_batch_size,
+                                     max_buffer=twitch_config.decision_max_buffer,
+                                     retention_days=twitch_config.decision_retention_days)
+        self.state = ShieldState(twitch_config.prediction_cache_ttl, twitch_config.user_cache_ttl,
+                                 twitch_config.cleared_ttl, twitch_config.state_max_entries, twitch_config.model_version or None)
+        self.snapshot_task = None
+        self.shared_cache = SharedCache(self.db_manager, self.state, self.l, twitch_config) if twitch_config.shared_cache_enabled else None
+        self.inflight = SingleFlight()
+        self.idempotency = IdempotencyCache(twitch_config.idempotency_window, twitch_config.idempotency_max_entries)
+        self.predictor = PredictionClient(twitch_config.shield_url, self.l, twitch_config.predictor_timeout, twitch_config.predictor_concurrency)
+        self.model_version = twitch_config.model_version or None
+        self.profiler = SamplingProfiler(twitch_config.profile_interval)
+        self.profile_dir = twitch_config.profile_dir
+        self.admin_console = AdminConsole(self.command_handler, self.l, twitch_config.admin_socket, twitch_config.admin_stdin)
+        self.stop_event = asyncio.Event()
 
         self.commands = {
         "help":{
@@ -156,6 +194,41 @@ class StreamerShieldTwitch:
                 "twt_func": self.scam_twitch,
                 "permissions": 0
                 },
+        "prefilter":{
+            "help": "!prefilter : prints blacklist prefilter statistics",
+                "value": False,
+                "cli_func": self.prefilter_cli,
+                "twt_func": self.prefilter_twitch,
+                "permissions": 10
+                },
+        "stats":{
+            "help": "!stats : prints StreamerShield decisions of the last 24 hours for this chat",
+                "value": True,
+                "cli_func": self.stats_cli,
+                "twt_func": self.stats_twitch,
+                "permissions": 5
+                },
+        "profile":{
+            "help": "!profile start|stop : samples the bot and records trace spans",
+                "value": True,
+                "cli_func": self.profile_cli,
+                "twt_func": self.profile_twitch,
+                "permissions": 10
+                },
+        "dedup":{
+            "help": "!dedup : prints counters of dropped duplicate events",
+                "value": False,
+                "cli_func": self.dedup_cli,
+                "twt_func": self.dedup_twitch,
+                "permissions": 10
+                },
+        "dbstats":{
+            "help": "!dbstats : prints database pool and query timings",
+                "value": False,
+                "cli_func": self.dbstats_cli,
+                "twt_func": self.dbstats_twitch,
+                "permissions": 10
+                },
         "test":{
             
             "help": "!scam [user_name] : evaluates username, if given",
@@ -171,33 +244,40 @@ class StreamerShieldTwitch:
         global twitch, auth, app, init_login
         
         self.l.info("Shield Starting up")
+        timer = PhaseTimer()
         
-        # Initialize database connection
-        await self.db_manager.initialize_pool()
-        await self.db_manager.create_tables()
-
-        twitch = await Twitch(self.__app_id, self.__app_secret)
-        auth = UserAuthenticator(twitch, self.user_scopes, url=self.auth_url)
+        # snapshot, database and Twitch app authentication do not depend on each other
+        await asyncio.gather(
+            timer.measure('snapshot', self.load_snapshot()),
+            timer.measure('database', self.prepare_database(timer)),
+            timer.measure('twitch app auth', self.create_twitch())
+        )
+        self.decisions.start()
+        if self.shared_cache:
+            self.shared_cache.start()
+        self.snapshot_task = asyncio.create_task(self.snapshot_loop())
 
-        while self.await_login:
-            try:
-                self.l.info("Shield awaiting initial login")
-                await asyncio.sleep(3)
-            except KeyboardInterrupt:
-                self.l.fail("Keyboard Interrupt, exiting")
-                await self.db_manager.close_pool()
-                raise KeyboardInterrupt("User specified shutdown")
+        self.l.info("Shield awaiting initial login")
+        login_started = time.perf_counter()
+        if not await self.wait_for_login():
+            self.l.fail("Stopped before initial login, exiting")
+            await self.shutdown()
+            return
+        login_done = time.perf_counter()
+        timer.add('awaiting login', login_started, login_done)
         self.l.passingblue("Shield initial login successful")
         self.l.passingblue("Welcome home Chief!")
         
-        self.eventsub = EventSubWebhook(self.eventsub_url, 8080, twitch, revocation_handler=self.esub_revoked)
-        await self.eventsub.unsubscribe_all() # unsub, otherwise stuff breaks
-        self.eventsub.start()
-        
+        # callbacks are dispatched onto this loop, so handlers share the loop with the database pool and Quart
+        loop = asyncio.get_running_loop()
+        self.eventsub = FollowEventSub(self.config, twitch, self.l, callback_loop=loop, revocation_handler=self.esub_revoked)
+        self.user, self.chat, _ = await asyncio.gather(
+            timer.measure('bot user', first(twitch.get_users(logins=self.user_name))),
+            timer.measure('chat', Chat(twitch, callback_loop=loop)),
+            timer.measure('eventsub', self.eventsub.start())
+        )
         self.l.passingblue("Started EventSub")
-        
-        self.user = await first(twitch.get_users(logins=self.user_name))
-        self.chat = await Chat(twitch)
+        self.sweeper = ChatterSweeper(twitch, self.user.id, self.check_user, self.state, self.l, self.config)
 
         # register the handlers for the events you want
         self.chat.register_event(ChatEvent.READY, self.on_ready)
@@ -210,68 +290,131 @@ class StreamerShieldTwitch:
         self.chat.start()
         
         self.running = True
+        await self.admin_console.start()
+
+        ready = time.perf_counter()
+        self.l.passingblue(f"Shield protecting chats {ready - timer.started - (login_done - login_started):.2f}s after start, not counting the login")
+        for line in timer.report():
+            self.l.info(f"Startup phase {line}")
         
         try:
-            await self.cli_run()
+            await self.stop_event.wait()
         finally:
-            await self.db_manager.close_pool()
+            await self.shutdown()
+
+    async def prepare_database(self, timer : PhaseTimer):
+        await timer.measure('database pool', self.db_manager.initialize_pool())
+        await timer.measure('database schema', self.db_manager.migrate())
+        await asyncio.gather(
+            timer.measure('blacklist prefilter', self.db_manager.load_blacklist_prefilter()),
+            timer.measure('known user index', self.db_manager.load_known_user_index())
+        )
+
+    async def create_twitch(self):
+        global twitch, auth
+        twitch = await Twitch(self.__app_id, self.__app_secret)
+        auth = UserAuthenticator(twitch, self.user_scopes, url=self.auth_url)
+
+    async def wait_for_login(self) -> bool:
+        login = asyncio.create_task(self.login_event.wait())
+        stop = asyncio.create_task(self.stop_event.wait())
+        await asyncio.wait({login, stop}, return_when=asyncio.FIRST_COMPLETED)
+        login.cancel()
+        stop.cancel()
+        return self.login_event.is_set()
+
+    async def shutdown(self):
+        self.running = False
+        await self.admin_console.close()
+        if self.sweeper:
+            self.sweeper.stop_all()
+        if self.chat:
+            try:
+                self.chat.stop() #sometimes is already gone when stopped, so...
+            except Exception:
+                pass
+        if self.eventsub:
+            try:
+                await self.eventsub.stop()
+            except Exception:
+                pass
+        try:
+            await twitch.close()
+        except Exception:
+            pass
+        await self.decisions.stop()
+        if self.shared_cache:
+            await self.shared_cache.stop()
+        await self.predictor.close()
+        await self.db_manager.close_pool()
+        if self.snapshot_task:
+            self.snapshot_task.cancel()
+        await self.save_snapshot()
+        self.l.info("Shield stopped")
+
+    async def load_snapshot(self):
+        try:
+            result = await asyncio.to_thread(self.state.load, self.config.snapshot_path, self.config.snapshot_max_age)
+            self.l.info(f"Warm start: {result}")
+        except Exception as e:
+            self.l.error(f"Failed to load state snapshot: {e}")
+
+    async def save_snapshot(self):
+        try:
+            # copy on the loop, where check_user modifies the state, and expire, serialize and write in a thread
+            await asyncio.to_thread(self.state.write, self.config.snapshot_path, self.state.copy())
+        except Exception as e:
+            self.l.error(f"Failed to write state snapshot: {e}")
+
+    async def snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.config.snapshot_interval)
+            await self.save_snapshot()
 
     def esub_revoked(self, diction : dict):
         self.l.error(f"EventSub was revoked {diction}")
             
             
     ### CLI Command Handling
-    async def command_handler(self, command :str):
+    async def command_handler(self, command :str) -> str:
+        """Run an admin command and return its output, which is also logged"""
         parts = command.split(" ")
         if parts[0] == '':
-            return
+            return ''
         if parts[0] not in self.commands.keys():
-            self.l.error(f'Command {parts[0]} unknown')
+            raise ValueError(f'Command {parts[0]} unknown, type help for available commands')
         if self.commands[parts[0]]['value']:
-           await self.commands[parts[0]]['cli_func'](parts[0])
-           return
-        await self.commands[parts[0]]['cli_func']()
-        
-    async def cli_run(self):
-        while self.running:
-            try:
-                com = input("type help for available commands\n")
-                await self.command_handler(com)
-            except Exception as e:
-                self.l.error(f'Exeption in cli_run, exiting: {e}')
-                exit(1)
+            if len(parts) < 2 or parts[1] == '':
+                raise ValueError(f'Command {parts[0]} requires an argument')
+            result = self.commands[parts[0]]['cli_func'](parts[1].replace("@", ""))
+        else:
+            result = self.commands[parts[0]]['cli_func']()
+        if inspect.isawaitable(result):
+            result = await result
+        for line in (result or '').splitlines():
+            self.l.info(line)
+        return result or ''
     
     def shield_info_cli(self):
-        self.l.info('''
-                    StreamerShield is the AI ChatBot to rid twitch once and for all from scammers. More information here: https://linktr.ee/caesarlp
-                    ''')
+        return 'StreamerShield is the AI ChatBot to rid twitch once and for all from scammers. More information here: https://linktr.ee/caesarlp'
     
     def help_cli(self):
-        for command, value in self.commands.items():
-            self.l.passing(f'{value["help"]}')
+        return '\n'.join(value["help"] for value in self.commands.values())
             
     async def stop_cli(self):
-        self.l.fail("Stopping!")
-        try:
-            self.chat.stop() #sometimes is already gone when stopped, so...
-        except Exception:
-            pass
-        try:
-            await twitch.close()
-        except Exception:
-            pass
-        raise Exception("Stopped by User") #not the most elegant but works
+        self.stop_event.set()
+        return "Stopping!"
     
     def arm_cli(self):
-        self.l.warning("Armed StreamerShield")
         self.is_armed = True
+        return "Armed StreamerShield"
         
     def disarm_cli(self):
-        self.l.warning("Disarmed StreamerShield")
         self.is_armed = False
+        return "Disarmed StreamerShield"
     
     def join_me_cli(self):
-        self.l.error("Cannot invoke join_me from cli, please use join instead")
+        raise ValueError("Cannot invoke join_me from cli, please use join instead")
     
     async def join_chat(self, name:str):
         global twitch
@@ -284,6 +427,7 @@ class StreamerShieldTwitch:
             self.l.passing(f"Successfully joined {name}")
             user = await first(twitch.get_users(logins=name))
             await self.db_manager.add_joinable_channel(name)
+            self.sweeper.start(name, user.id)
             try:
                 await self.new_follow_esub(user.id)
             except Exception:
@@ -304,39 +448,104 @@ class StreamerShieldTwitch:
             self.l.error(f'Error whilst subscribing to eventsub: EventSubSubscriptionError {e}')
         except TwitchBackendException as e:
             self.l.error(f'Error whilst subscribing to eventsub: TwitchBackendException {e}')
+        except RuntimeError as e:
+            self.l.error(f'Error whilst subscribing to eventsub: {e}')
+
+    async def remove_follow_esub(self, name : str):
+        user = await first(twitch.get_users(logins=name))
+        if user is None:
+            return
+        try:
+            await self.eventsub.unsubscribe(user.id)
+        except Exception as e:
+            self.l.error(f'Error whilst unsubscribing from eventsub: {e}')
         
         
     async def leave_cli(self, name:str):
         await self.chat.leave_room(name)
+        await self.remove_follow_esub(name)
+        self.sweeper.stop(name)
         await self.db_manager.remove_joinable_channel(name)
-        self.l.passing(f"Left {name}")
+        return f"Left {name}"
         
     async def whitelist_cli(self, name:str):
         await self.db_manager.add_to_whitelist(name)
-        self.l.passing(f"Whitelisted {name}")
+        return f"Whitelisted {name}"
 
     async def unwhitelist_cli(self, name:str):
         await self.db_manager.remove_from_whitelist(name)
-        self.l.passing(f"Unwhitelisted {name}")
+        self.state.forget(name)
+        return f"Unwhitelisted {name}"
 
     async def blacklist_cli(self, name:str):
         await self.db_manager.add_to_blacklist(name)
-        self.l.passing(f"Blacklisted {name}")
+        self.state.forget(name)
+        return f"Blacklisted {name}"
 
     async def unblacklist_cli(self, name:str):
         await self.db_manager.remove_from_blacklist(name)
-        self.l.passing(f"Unblacklisted {name}")
+        return f"Unblacklisted {name}"
 
     async def scam_cli(self, name:str):
         conf = await self.request_prediction(name) #will come in *1000 for use in json
-        self.l.info(f'User {name} returns conf {conf/1000}')
+        if conf is None:
+            raise RuntimeError(f'Prediction for {name} failed')
+        return f'User {name} returns conf {conf/1000}'
   
+    def prefilter_cli(self):
+        return f'Prefilter stats: {self.db_manager.blacklist_prefilter.stats()}'
+
+    async def stats_cli(self, name:str):
+        user = await first(twitch.get_users(logins=name))
+        since = datetime.now(timezone.utc) - timedelta(days=1)
+        lines = [f'Decisions in {name} during the last 24 hours: {await self.db_manager.get_decision_counts(user.id, since)}']
+        for stage, latency in (await self.db_manager.get_stage_latencies(user.id, since)).items():
+            lines.append(f'{stage}: {latency}')
+        return '\n'.join(lines)
+
+    def start_profiling(self) -> str:
+        if self.profiler.running:
+            return "Profiler is already running"
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.profile_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        tracer.start(os.path.join(self.profile_dir, f'trace_{self.profile_stamp}.jsonl'))
+        self.profiler.start()
+        return f"Profiling started, writing to {self.profile_dir}"
+
+    def stop_profiling(self) -> str:
+        if not self.profiler.running:
+            return "Profiler is not running"
+        self.profiler.stop()
+        tracer.stop()
+        path = os.path.join(self.profile_dir, f'profile_{self.profile_stamp}.folded')
+        self.profiler.write(path)
+        return f"Profiling stopped, {sum(self.profiler.samples.values())} samples written to {path}"
+
+    def profile_cli(self, action:str):
+        if action == 'start':
+            return self.start_profiling()
+        if action == 'stop':
+            return self.stop_profiling()
+        raise ValueError('Usage: profile start|stop')
+
+    def dedup_cli(self):
+        return f'Idempotency cache: {self.idempotency.stats()}, in-flight checks: {self.inflight.stats()}'
+
+    def dbstats_cli(self):
+        stats = self.db_manager.stats()
+        lines = [f'Database pool: {stats.get("pool")}, pool wait: {stats["pool_wait"]}']
+        for name, timing in stats['queries'].items():
+            lines.append(f'{name}: {timing}')
+        if self.shared_cache:
+            lines.append(f'Shared cache: {self.shared_cache.stats()}')
+        return '\n'.join(lines)
+
     def pat_cli(self, name:str):
-        self.l.passingblue(f"You're a good boi!")
+        return "You're a good boi!"
     
     async def test_cli(self, name:str):
-        self.l.info(f'Restricting {name}')
         await self.chat.send_message('caesarlp', f'/restrict {name}')
+        return f'Restricting {name}'
     
     ### Twitch Command Handling
 
@@ -375,6 +584,8 @@ class StreamerShieldTwitch:
             await chat_command.reply("Leaving... Bye!")
             await self.db_manager.remove_joinable_channel(chat_command.parameter)
             await self.chat.leave_room(chat_command.parameter)
+            await self.remove_follow_esub(chat_command.parameter)
+            self.sweeper.stop(chat_command.parameter)
             
     async def leave_twitch(self, chat_command : ChatCommand):
         if await self.verify_permission(
@@ -383,6 +594,8 @@ class StreamerShieldTwitch:
             await chat_command.reply("Leaving... Bye!")
             await self.db_manager.remove_joinable_channel(chat_command.parameter)
             await self.chat.leave_room(chat_command.parameter)
+            await self.remove_follow_esub(chat_command.parameter)
+            self.sweeper.stop(chat_command.parameter)
         
     async def whitelist_twitch(self, chat_command : ChatCommand):
         if await self.verify_permission(chat_command, "whitelist"):
@@ -394,12 +607,14 @@ class StreamerShieldTwitch:
         if await self.verify_permission(chat_command, "unwhitelist"):
             name = chat_command.parameter.replace("@", "")
             await self.db_manager.remove_from_whitelist(name)
+            self.state.forget(name)
             await chat_command.reply(f'User {name} is no longer whitelisted')
             
     async def blacklist_twitch(self, chat_command : ChatCommand):
         if await self.verify_permission(chat_command, "blacklist"):
             name = chat_command.parameter.replace("@", "")
             await self.db_manager.add_to_blacklist(name)
+            self.state.forget(name)
             await chat_command.reply(f'User {name} is now blacklisted')
         
     async def unblacklist_twitch(self, chat_command : ChatCommand):
@@ -416,6 +631,9 @@ class StreamerShieldTwitch:
             name = chat_command.user.name
             
         conf = await self.request_prediction(name) #will come in *1000 for use in json
+        if conf is None:
+            await chat_command.reply(f'Could not get a prediction for @{name}, try again later')
+            return
             
         await chat_command.reply(f'@{name} is to {conf/10}% a scammer')
         
@@ -435,6 +653,38 @@ class StreamerShieldTwitch:
             return
         await chat_command.reply(f'@{chat_command.user.name} gives @{name} a pat! peepoPat {pats} pats have been given')
     
+    async def prefilter_twitch(self, chat_command : ChatCommand):
+        if await self.verify_permission(chat_command, "prefilter"):
+            stats = self.db_manager.blacklist_prefilter.stats()
+            await chat_command.reply(', '.join(f'{key}: {value}' for key, value in stats.items()))
+
+    async def stats_twitch(self, chat_command : ChatCommand):
+        if await self.verify_permission(chat_command, "stats"):
+            since = datetime.now(timezone.utc) - timedelta(days=1)
+            counts = await self.db_manager.get_decision_counts(chat_command.room.room_id, since)
+            if not counts:
+                await chat_command.reply('No decisions in the last 24 hours')
+                return
+            await chat_command.reply('Last 24 hours: ' + ', '.join(f'{action}: {total}' for action, total in counts.items()))
+
+    async def profile_twitch(self, chat_command : ChatCommand):
+        if await self.verify_permission(chat_command, "profile"):
+            if chat_command.parameter == 'start':
+                await chat_command.reply(self.start_profiling())
+            elif chat_command.parameter == 'stop':
+                await chat_command.reply(self.stop_profiling())
+            else:
+                await chat_command.reply('Usage: !profile start|stop')
+
+    async def dedup_twitch(self, chat_command : ChatCommand):
+        if await self.verify_permission(chat_command, "dedup"):
+            await chat_command.reply(f'{self.idempotency.stats()}')
+
+    async def dbstats_twitch(self, chat_command : ChatCommand):
+        if await self.verify_permission(chat_command, "dbstats"):
+            stats = self.db_manager.stats()
+            await chat_command.reply(f'pool: {stats.get("pool")}, pool wait: {stats["pool_wait"]}')
+
     async def test_twitch(self,  chat_command : ChatCommand):
         name = chat_command.parameter.replace("@", "")
         await chat_command.reply(f'Trying to restrict user {name}')
@@ -442,12 +692,14 @@ class StreamerShieldTwitch:
         await self.chat.send_raw_irc_message(f'/restrict {name}')
     ###Event Subs and Chat events
     
+    @traced('event.ready')
     async def on_ready(self,ready_event: EventData):
         channels = await self.db_manager.get_joinable_channels()
         channels.append(self.chat.username)
         await ready_event.chat.join_room(channels)
         for channel in channels:
             user = await first(twitch.get_users(logins = [channel]))
+            self.sweeper.start(channel, user.id)
             try:
                 await self.new_follow_esub(user.id)
             except:
@@ -457,45 +709,68 @@ class StreamerShieldTwitch:
     async def on_joined(self, joined_event: JoinedEvent):
         await joined_event.chat.send_message(joined_event.room_name, "This Chat is now protected with StreamerShield! protecc")
         
+    @traced('event.message')
     async def on_message(self, msg : ChatMessage):
         name = msg.user.name
         privilege = (msg.user.mod or msg.user.vip or msg.user.subscriber or msg.user.turbo)
         if(privilege):
             await self.db_manager.add_to_whitelist(name)
             return
+        # JOIN and MESSAGE of the same user in a room lead to the same check, so they share one key
+        if self.idempotency.is_duplicate((msg.room.room_id, name.lower(), 'presence'), 'message'):
+            return
         await self.check_user(name, msg.room.room_id)
         
+    @traced('event.join')
     async def on_join(self, join_event : JoinEvent):
         name = join_event.user_name
+        if self.idempotency.is_duplicate((join_event.room.room_id, name.lower(), 'presence'), 'join'):
+            return
         
         await self.check_user(name, join_event.room.room_id)
     
     
     # Onfollow will only work with headless webhook approach
        
+    @traced('event.follow')
     async def on_follow(self, data: ChannelFollowEvent):
         name = data.event.user_name
+        # twitchAPI already drops redeliveries of a message id, this catches the same follow arriving again,
+        # e.g. through a second shard or subscription of the channel
+        key = (data.event.broadcaster_user_id, data.event.user_id, 'follow', str(data.event.followed_at))
+        if self.idempotency.is_duplicate(key, 'follow'):
+            return
         self.l.passing(f"WE GOT A FOLLOW!!!!! {name}")
         await self.check_user(name, data.event.broadcaster_user_id)
     
     
     ### StreamerShield Main
+    @traced('check_user')
     async def check_user(self, name :str, room_name_id):
-        if await self.check_white_list(name): 
-            self.l.info(f"{name} is found in whitelist")
+        started = time.perf_counter()
+        if self.state.is_cleared(room_name_id, name):
             return
+        # concurrent checks of the same user share one evaluation, every room then applies its own action
+        verdict = await self.inflight.do(name.lower(), lambda: self.evaluate_user(name))
+        await self.apply_verdict(name, room_name_id, verdict, started)
+
+    async def evaluate_user(self, name :str) -> Verdict:
+        if await self.check_white_list(name): 
+            return Verdict('whitelist')
+        rule = self.db_manager.blacklist_prefilter.match(name)
+        if rule is not None:
+            return Verdict('prefilter', rule=rule)
         if await self.check_black_list(name): 
-            self.l.warning(f"{name} is found in blacklist")
-            if self.is_armed:
-                user = await first(twitch.get_users(logins=name))
-                await self.chat.send_message(room_name_id, f'/restrict {name}')
-                #await twitch.ban_user(room_name_id, room_name_id, user.id, self.ban_reason)
-            return
+            return Verdict('blacklist')
         #get prediction from REST 
         conf = await self.request_prediction(name) #will come in *1000 for use in json
+        if conf is None:
+            return Verdict('error', rule='prediction failed')
         
         #if datacollection is turned on, collect known users and their account age
-        user = await first(twitch.get_users(logins=name))
+        user = await self.resolve_user(name)
+        if user is None:
+            return Verdict('error', rule='user not found')
         if self.collect_data and (not await self.check_known_users(name)):
             age = await self.calculate_account_age(user)
             await self.db_manager.add_known_user(
@@ -503,26 +778,85 @@ class StreamerShieldTwitch:
                 confidence_score=math.floor(conf),
                 account_age_years=age[0],
                 account_age_months=age[1],
-                account_age_days=age[2]
+                account_age_days=age[2],
+                model_version=self.model_version
             )
 
         conf = conf/1000 #turn into actual conf 0...1
         #check for account age    
         if await self.check_account_age(user=user):
+            return Verdict('account_age', conf=conf, user=user)
+        return Verdict('prediction', conf=conf, user=user)
+
+    async def apply_verdict(self, name :str, room_name_id, verdict : Verdict, started : float):
+        conf = verdict.conf
+        if verdict.stage == 'whitelist':
+            self.l.info(f"{name} is found in whitelist")
+            self.state.clear(room_name_id, name)
+            self.decisions.record(room_name_id, name, 'whitelist', 'none', started=started)
+            return
+        if verdict.stage == 'prefilter':
+            self.l.warning(f"{name} is matched by prefilter ({verdict.rule})")
+            action = await self.restrict_user(name, room_name_id)
+            self.decisions.record(room_name_id, name, 'prefilter', action, started=started)
+            return
+        if verdict.stage == 'blacklist':
+            self.l.warning(f"{name} is found in blacklist")
+            action = await self.restrict_user(name, room_name_id)
+            self.decisions.record(room_name_id, name, 'blacklist', action, started=started)
+            return
+        if verdict.stage == 'error':
+            # not cleared, so the next event of this user is checked again
+            self.l.error(f"Could not check {name}: {verdict.rule}")
+            self.decisions.record(room_name_id, name, 'error', 'none', started=started)
+            return
+        if verdict.stage == 'account_age':
             self.l.passing(f'Found Account older than {self.age_threshold} Months, name : {name}, conf: {conf})')
+            self.state.clear(room_name_id, name)
+            self.decisions.record(room_name_id, name, 'account_age', 'none', conf, started)
             return
         
         
-        if (bool(np.round(conf))):
+        if (bool(round(conf))):
+            action = 'flag'
             if self.is_armed:
                 #TODO: Check either for account age or follow count if possible
                 self.l.fail(f'Banned user {name}')
-                await twitch.ban_user(room_name_id, self.user.id, user.id, self.ban_reason) #self.user to ban using the Streamershield account
+                with tracer.span('helix.ban_user'):
+                    await twitch.ban_user(room_name_id, self.user.id, verdict.user.id, self.ban_reason) #self.user to ban using the Streamershield account
+                action = 'ban'
             self.l.warning(f'User {name} was classified as a scammer with conf {conf}')
+            self.decisions.record(room_name_id, name, 'prediction', action, conf, started)
             return
         self.l.passing(f'User {name} was classified as a human with conf {conf}')
+        self.state.clear(room_name_id, name)
+        self.decisions.record(room_name_id, name, 'prediction', 'none', conf, started)
             
     
+    async def resolve_user(self, name :str):
+        user = self.state.get_user(name)
+        if user is not None:
+            return user
+        if self.shared_cache:
+            user = await self.shared_cache.get_user(name)
+            if user is not None:
+                self.state.put_user(name, user)
+                return user
+        with tracer.span('helix.get_users'):
+            user = await first(twitch.get_users(logins=name))
+        if user is not None:
+            self.state.put_user(name, user)
+            if self.shared_cache:
+                self.shared_cache.put_user(name, user)
+        return user
+
+    async def restrict_user(self, name :str, room_name_id) -> str:
+        if self.is_armed:
+            await self.chat.send_message(room_name_id, f'/restrict {name}')
+            #await twitch.ban_user(room_name_id, room_name_id, user.id, self.ban_reason)
+            return 'restrict'
+        return 'flag'
+
     async def calculate_account_age(self, user: TwitchUser):
         current_time = datetime.now()
         creation_time = user.created_at
@@ -586,15 +920,25 @@ class StreamerShieldTwitch:
 
     # Remove the old load_list and list_update methods as they're replaced by database operations
     async def request_prediction(self, name : str):
-        data = {"input_string": name}
-
-        response = requests.post(self.shield_url, json=data)
-
-        if response.status_code == 200:
-            return response.json()["result"]
-            
-        else:
-            self.l.error(response.json())
+        conf = self.state.get_prediction(name)
+        if conf is not None:
+            return conf
+        if self.shared_cache:
+            conf = await self.shared_cache.get_prediction(name)
+            if conf is not None:
+                self.state.put_prediction(name, conf)
+                return conf
+        try:
+            with tracer.span('predictor'):
+                conf = await self.predictor.predict(name)
+        except Exception as e:
+            self.l.error(f'Prediction for {name} failed: {e!r}')
+            return None
+        if conf is not None:
+            self.state.put_prediction(name, conf)
+            if self.shared_cache:
+                self.shared_cache.put_prediction(name, conf)
+        return conf
 
 
 app = Quart(__name__)
@@ -611,6 +955,8 @@ app.secret_key = 'your_secret_key'
 
 @app.route('/login')
 def login():
+    if auth is None:
+        return 'Shield is starting up', 503
     return redirect(auth.return_auth_url())
 
 @app.route('/health')
@@ -621,6 +967,8 @@ def health():
 @app.route('/login/confirm')
 async def login_confirm():
     global session, chat_bot
+    if auth is None:
+        return 'Shield is starting up', 503
     args = request.args
     state = request.args.get('state')
     if state != auth.state:
@@ -631,45 +979,48 @@ async def login_confirm():
     try:
         token, refresh = await auth.authenticate(user_token=code)
        
-        if chat_bot.await_login:
+        if not chat_bot.login_event.is_set():
             await twitch.set_user_authentication(token, TARGET_SCOPE, refresh)
             ret_val = "Welcome home chief!"
             
         user_info = await first(twitch.get_users())
         name = user_info.login
         
-        if not chat_bot.await_login:
+        if chat_bot.login_event.is_set():
             ret_val =  await chat_bot.join_chat(name)
         
     except TwitchAPIException as e:
         return 'Failed to generate auth token', 400
     
-    chat_bot.await_login = False
+    chat_bot.login_event.set()
     return ret_val
 
 
     
 
  
-def main():
-    asyncio.run(chat_bot.run())
+async def main(config: TwitchConfig):
+    """Serve the Quart app with hypercorn on the same event loop as the bot"""
+    global chat_bot, TARGET_SCOPE
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
 
+    TARGET_SCOPE = config.user_scopes
+    chat_bot = StreamerShieldTwitch(config)
 
-        
-        
-        
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, chat_bot.stop_event.set)
 
+    hypercorn_config = HypercornConfig()
+    hypercorn_config.bind = [f'{config.http_host}:{config.http_port}']
+    server = asyncio.create_task(serve(app, hypercorn_config, shutdown_trigger=chat_bot.stop_event.wait))
+    try:
+        await chat_bot.run()
+    finally:
+        chat_bot.stop_event.set()
+        await server
 
 
 if __name__ == "__main__":
-    config = TwitchConfig()
-    TARGET_SCOPE = config.user_scopes
-
-    chat_bot = StreamerShieldTwitch(config)
-    
-    process2 = threading.Thread(target=main)
-
-    process2.start()
-    app.run('0.0.0.0')
-
-    process2.join()
+    asyncio.run(main(TwitchConfig()))
@@ -21,17 +21,98 @@ class TwitchConfig:
         self.db_user: str = os.getenv('DB_USER', 'postgres')
         self.db_password: str = os.getenv('DB_PASSWORD', 'password')
 
+        # Database pool tuning, timeouts are in seconds and 0 disables them
+        self.db_pool_min_size: int = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+        self.db_pool_max_size: int = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+        self.db_command_timeout: float = float(os.getenv('DB_COMMAND_TIMEOUT', '30'))
+        self.db_acquire_timeout: float = float(os.getenv('DB_ACQUIRE_TIMEOUT', '10'))
+        self.db_max_inactive_connection_lifetime: float = float(os.getenv('DB_MAX_INACTIVE_CONNECTION_LIFETIME', '300'))
+        self.db_max_queries: int = int(os.getenv('DB_MAX_QUERIES', '50000'))
+        self.db_statement_cache_size: int = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+        self.db_pool_wait_warning_ms: float = float(os.getenv('DB_POOL_WAIT_WARNING_MS', '100'))
+
         # URLs with defaults
         self.eventsub_url: str = os.getenv('EVENTSUB_URL', 'https://webhook.caes.ar')
         self.shield_url: str = os.getenv('SHIELD_URL', 'http://localhost:38080/api/predict')
         self.auth_url: str = os.getenv('AUTH_URL', 'https://shield.caes.ar/login/confirm')
 
+        # Periodic chatter list sweep, intervals in seconds and the budget in Helix requests per minute
+        self.sweep_interval: float = float(os.getenv('SWEEP_INTERVAL', '120'))
+        self.sweep_min_interval: float = float(os.getenv('SWEEP_MIN_INTERVAL', '30'))
+        self.sweep_max_interval: float = float(os.getenv('SWEEP_MAX_INTERVAL', '900'))
+        self.sweep_request_budget: float = float(os.getenv('SWEEP_REQUEST_BUDGET', '120'))
+        self.sweep_concurrency: int = int(os.getenv('SWEEP_CONCURRENCY', '16'))
+        self.sweep_max_new: int = int(os.getenv('SWEEP_MAX_NEW', '1000'))
+
+        # Prediction service client
+        self.predictor_timeout: float = float(os.getenv('PREDICTOR_TIMEOUT', '10'))
+        self.predictor_concurrency: int = int(os.getenv('PREDICTOR_CONCURRENCY', '64'))
+        self.model_version: str = os.getenv('MODEL_VERSION', '')
+
+        # EventSub transport, either 'webhook' (behind EVENTSUB_URL) or 'websocket'
+        self.eventsub_transport: str = os.getenv('EVENTSUB_TRANSPORT', 'webhook').lower()
+        if self.eventsub_transport not in ('webhook', 'websocket'):
+            raise ValueError('EVENTSUB_TRANSPORT must be either webhook or websocket')
+        self.eventsub_ws_url: str = os.getenv('EVENTSUB_WS_URL', '')
+        self.eventsub_ws_subscription_url: str = os.getenv('EVENTSUB_WS_SUBSCRIPTION_URL', '')
+        self.eventsub_ws_shard_size: int = int(os.getenv('EVENTSUB_WS_SHARD_SIZE', '300'))
+        self.eventsub_ws_max_shards: int = int(os.getenv('EVENTSUB_WS_MAX_SHARDS', '3'))
+
         # Bot behavior settings with defaults
         self.is_armed: bool = os.getenv('IS_ARMED', 'true').lower() == 'true'
         self.collect_data: bool = os.getenv('COLLECT_DATA', 'true').lower() == 'true'
         self.age_threshold: int = int(os.getenv('AGE_THRESHOLD', '6'))
         self.max_length: int = int(os.getenv('MAX_LENGTH', '31'))
 
+        # In-memory caches and their warm-start snapshot, times are in seconds
+        self.prediction_cache_ttl: float = float(os.getenv('PREDICTION_CACHE_TTL', '86400'))
+        self.user_cache_ttl: float = float(os.getenv('USER_CACHE_TTL', '604800'))
+        self.cleared_ttl: float = float(os.getenv('CLEARED_TTL', '86400'))
+        self.state_max_entries: int = int(os.getenv('STATE_MAX_ENTRIES', '1000000'))
+        self.snapshot_path: str = os.getenv('SNAPSHOT_PATH', 'state/shield_state.snapshot')
+        self.snapshot_interval: float = float(os.getenv('SNAPSHOT_INTERVAL', '300'))
+        self.snapshot_max_age: float = float(os.getenv('SNAPSHOT_MAX_AGE', '21600'))
+
+        # Prediction and user cache shared by all instances through the database, times are in seconds
+        self.shared_cache_enabled: bool = os.getenv('SHARED_CACHE_ENABLED', 'true').lower() == 'true'
+        self.shared_cache_flush_interval: float = float(os.getenv('SHARED_CACHE_FLUSH_INTERVAL', '0.5'))
+        self.shared_cache_read_delay: float = float(os.getenv('SHARED_CACHE_READ_DELAY', '0.002'))
+        self.shared_cache_cleanup_interval: float = float(os.getenv('SHARED_CACHE_CLEANUP_INTERVAL', '600'))
+
+        # On-demand profiling, started with the profile admin command
+        self.profile_dir: str = os.getenv('PROFILE_DIR', 'profiles')
+        self.profile_interval: float = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+
+        # Duplicate event suppression
+        self.idempotency_window: float = float(os.getenv('IDEMPOTENCY_WINDOW', '60'))
+        self.idempotency_max_entries: int = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '100000'))
+
+        # Moderation decision log
+        self.decision_flush_interval: float = float(os.getenv('DECISION_FLUSH_INTERVAL', '5'))
+        self.decision_batch_size: int = int(os.getenv('DECISION_BATCH_SIZE', '500'))
+        self.decision_max_buffer: int = int(os.getenv('DECISION_MAX_BUFFER', '100000'))
+        self.decision_retention_days: int = int(os.getenv('DECISION_RETENTION_DAYS', '30'))
+
+        # Username prefilter settings, patterns are regular expressions, one per line since commas occur in {m,n}
+        self.prefilter_patterns: list[str] = [p.strip() for p in os.getenv('PREFILTER_PATTERNS', '').splitlines() if p.strip()]
+        prefilter_patterns_file: str = os.getenv('PREFILTER_PATTERNS_FILE', '')
+        if prefilter_patterns_file:
+            with open(prefilter_patterns_file, encoding='utf-8') as f:
+                self.prefilter_patterns += [p.strip() for p in f if p.strip()]
+        self.prefilter_match_templates: bool = os.getenv('PREFILTER_MATCH_TEMPLATES', 'false').lower() == 'true'
+
+        # HTTP server for the login flow and health checks, served on the bot's event loop
+        self.http_host: str = os.getenv('HTTP_HOST', '0.0.0.0')
+        self.http_port: int = int(os.getenv('HTTP_PORT', '5000'))
+
+        # Admin interface, commands are accepted on a local Unix socket and on stdin if it is a terminal
+        self.admin_socket: str = os.getenv('ADMIN_SOCKET', '/tmp/streamer_shield.sock')
+        self.admin_stdin: bool = os.getenv('ADMIN_STDIN', 'true').lower() == 'true'
+
+        # Known user index sizing, memory is roughly 1.2 bytes per expected user at a 1% error rate
+        self.known_users_capacity: int = int(os.getenv('KNOWN_USERS_CAPACITY', '5000000'))
+        self.known_users_error_rate: float = float(os.getenv('KNOWN_USERS_ERROR_RATE', '0.01'))
+
         # Static settings
         self.ban_reason: str = '''You've been banned by StreamerShield, if you think this was an Error, please make an unban request'''
         self.logger: Logger = Logger(console_log=True)
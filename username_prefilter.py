@@ -0,0 +1,82 @@
+import re
+from typing import Iterable, List, Optional
+
+
+class UsernamePrefilter:
+    """In-memory prefilter that matches usernames against the blacklist and operator patterns"""
+
+    def __init__(self, patterns: Optional[List[str]] = None, match_templates: bool = False):
+        self.names: set = set()
+        self.templates: dict = {}
+        self.match_templates = match_templates
+        self.patterns: List[str] = [p for p in (patterns or []) if p]
+        self.compiled: List[re.Pattern] = [self.compile(p) for p in self.patterns]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def compile(pattern: str) -> re.Pattern:
+        try:
+            return re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f'Invalid prefilter pattern {pattern!r}: {e}') from e
+
+    @staticmethod
+    def template(name: str) -> str:
+        """Collapse digit runs so that 'scammer123' and 'scammer7' share a template"""
+        return re.sub(r'\d+', '#', name.lower())
+
+    def load(self, names: Iterable[str]):
+        """Replace the blacklist entries with the given names"""
+        self.names = set()
+        self.templates = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str):
+        """Add a single blacklist entry"""
+        name = name.lower()
+        if name in self.names:
+            return
+        self.names.add(name)
+        key = self.template(name)
+        self.templates[key] = self.templates.get(key, 0) + 1
+
+    def remove(self, name: str):
+        """Remove a single blacklist entry"""
+        name = name.lower()
+        if name not in self.names:
+            return
+        self.names.discard(name)
+        key = self.template(name)
+        if self.templates.get(key, 0) <= 1:
+            self.templates.pop(key, None)
+        else:
+            self.templates[key] -= 1
+
+    def match(self, name: str) -> Optional[str]:
+        """Return a description of the matching rule, or None if the name passes"""
+        lowered = name.lower()
+        rule = None
+        if lowered in self.names:
+            rule = 'blacklist'
+        elif self.match_templates and self.template(lowered) in self.templates:
+            rule = f'template {self.template(lowered)}'
+        else:
+            for compiled in self.compiled:
+                if compiled.search(lowered):
+                    rule = f'pattern {compiled.pattern}'
+                    break
+        if rule is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rule
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.names),
+            'patterns': len(self.patterns),
+            'hits': self.hits,
+            'misses': self.misses
+        }